@@ -1,17 +1,24 @@
 import argparse
+import os
 import sys
 
 from sam3_tools.text_segmentation import run_text_segmentation
 from sam3_tools.auto_segmentation import run_auto_segmentation
 from sam3_tools.box_segmentation import run_box_segmentation
 from sam3_tools.point_segmentation import run_point_segmentation
-# from sam3_tools.shared_utils import load_or_create_config, get_config_path
+from sam3_tools.exemplar_segmentation import run_exemplar_segmentation
+from sam3_tools.text_cache import get_text_cache
+from sam3_tools.result_store import get_result_store
+from sam3_tools.batch import run_batch
+from sam3_tools.watch import run_watch
+from sam3_tools.memory import MemoryGovernor, parse_size, report_peak_rss
+from sam3_tools.shared_utils import load_or_create_config, get_config_path
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="SAM3 segmentation tool")
 
-    parser.add_argument("-i", "--input", required=False, help="Input image path")
+    parser.add_argument("-i", "--input", required=False, help="Input image path, or a folder to process every image in it (text, auto, and box or exemplar with coordinates)")
     parser.add_argument("-o", "--output", required=False, help="Output folder")
     parser.add_argument("-n", "--num-masks", type=int, default=3, help="Number of masks to save (box and auto mode only)")
     parser.add_argument("-s", "--box", nargs=4, type=int, help="Generate masks from a box selection. Optional box coordinate: x1 y1 x2 y2")
@@ -19,10 +26,36 @@ def parse_args():
     parser.add_argument("--points", action="store_true", help="Generate masks from point-based selection")
     parser.add_argument("--text", type=str, help="Generate masks from text prompt")
     parser.add_argument("--auto", action="store_true", help="Generate automatic masks")
+    parser.add_argument("--exemplar", action="store_true", help="Mask every instance that looks like the object in the selected box (use with -s or draw the box)")
+    parser.add_argument("--dedup-iou", type=float, default=0.7, help="Auto mode: drop masks overlapping a better one above this IoU (default: 0.7)")
+    parser.add_argument("--persist-text-cache", action="store_true", help="Keep encoded text prompts on disk between runs (text mode only)")
+    parser.add_argument("--no-result-cache", action="store_true", help="Always run the model, even for a request that was already answered")
+    parser.add_argument("--result-cache-mb", type=int, default=1024, help="Size limit of the result cache in MB (default: 1024)")
+    parser.add_argument("--manifest", type=str, help="Batch progress manifest (default: <output>/sam3_manifest.jsonl)")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per image, across runs, before a batch gives up on it (default: 3)")
+    parser.add_argument("--retries-per-run", type=int, default=1, help="Batch: immediate retries of a failed image; remaining attempts wait for the next run (default: 1)")
+    parser.add_argument("--retry-failed", action="store_true", help="Batch: try images again that already used up --max-attempts")
+    parser.add_argument("--decode-workers", type=int, default=2, help="Batch: threads decoding upcoming images during inference (default: 2)")
+    parser.add_argument("--write-workers", type=int, default=2, help="Batch: threads writing finished masks (default: 2)")
+    parser.add_argument("--queue-depth", type=int, default=2, help="Batch: max images waiting between pipeline stages (default: 2)")
+    parser.add_argument("--max-memory", type=str, help="Memory budget, e.g. 8G; decode and batch sizes are reduced to stay under it")
+    parser.add_argument("--watch", type=str, metavar="DIR", help="Keep the model loaded and segment each image that lands in DIR (text, auto, and box or exemplar with coordinates)")
+    parser.add_argument("--settle-time", type=float, default=1.0, help="Watch: seconds a file must stay unchanged before it is processed (default: 1.0)")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Watch: seconds between folder scans when watchdog is not installed (default: 1.0)")
     parser.add_argument("--config", action="store_true", help="Create config file if missing and show the path")
+    parser.add_argument("--tune", action="store_true", help="Benchmark this machine and save the fastest performance settings to the config file")
     return parser.parse_args()
 
 
+def batch_mode(args):
+    """Non-interactive mode for batch and watch runs, same priority as below."""
+    if args.text:
+        return "text"
+    if args.auto:
+        return "auto"
+    return "exemplar" if args.exemplar else "box"
+
+
 def main():
     args = parse_args()
 
@@ -35,8 +68,71 @@ def main():
         cfg = load_or_create_config()
         print("Config file is ready at:", get_config_path())
         sys.exit(0)
+    if args.tune:
+        from sam3_tools.tune import run_tune
+        run_tune()
+        sys.exit(0)
+
+    result_store = None
+    if not args.no_result_cache:
+        result_store = get_result_store(max_bytes=args.result_cache_mb * 1024 * 1024)
+
+    memory = None
+    if args.max_memory:
+        memory = MemoryGovernor(parse_size(args.max_memory))
+
+    # A watched folder keeps the model warm and handles images as they arrive
+    if args.watch:
+        if args.points:
+            print("Point mode is interactive and cannot watch a folder.")
+            sys.exit(1)
+        mode = batch_mode(args)
+        run_watch(
+            watch_dir=args.watch,
+            output_path=args.output,
+            mode=mode,
+            num_masks=args.num_masks,
+            pfm=args.pfm,
+            prompt=args.text,
+            box=args.box,
+            settle_time=args.settle_time,
+            poll_interval=args.poll_interval,
+            result_store=result_store,
+            text_cache=get_text_cache(persist=args.persist_text_cache),
+            memory=memory,
+            dedup_iou=args.dedup_iou,
+        )
+        return
 
-    # Priority: Text → Points → Auto → Box
+    # A folder as input runs a resumable batch
+    if args.input and os.path.isdir(args.input):
+        if args.points:
+            print("Point mode is interactive and cannot run as a batch.")
+            sys.exit(1)
+        mode = batch_mode(args)
+        run_batch(
+            input_dir=args.input,
+            output_path=args.output,
+            mode=mode,
+            num_masks=args.num_masks,
+            pfm=args.pfm,
+            prompt=args.text,
+            box=args.box,
+            manifest_path=args.manifest,
+            max_attempts=args.max_attempts,
+            retries_per_run=args.retries_per_run,
+            retry_failed=args.retry_failed,
+            decode_workers=args.decode_workers,
+            write_workers=args.write_workers,
+            queue_depth=args.queue_depth,
+            result_store=result_store,
+            text_cache=get_text_cache(persist=args.persist_text_cache),
+            dedup_iou=args.dedup_iou,
+            memory=memory,
+        )
+        return
+
+    # Priority: Text → Points → Auto → Exemplar → Box
     if args.text:
         run_text_segmentation(
             input_path=args.input,
@@ -44,7 +140,9 @@ def main():
             prompt=args.text,
             num_masks=args.num_masks,
             pfm=args.pfm,
-
+            text_cache=get_text_cache(persist=args.persist_text_cache),
+            result_store=result_store,
+            memory=memory,
         )
 
     elif args.points:
@@ -61,6 +159,20 @@ def main():
             output_path=args.output,
             num_masks=args.num_masks,
             pfm=args.pfm,
+            result_store=result_store,
+            dedup_iou=args.dedup_iou,
+            memory=memory,
+        )
+
+    elif args.exemplar:
+        run_exemplar_segmentation(
+            input_path=args.input,
+            output_path=args.output,
+            num_masks=args.num_masks,
+            box=args.box,
+            pfm=args.pfm,
+            result_store=result_store,
+            memory=memory,
         )
 
     else:
@@ -70,7 +182,11 @@ def main():
             num_masks=args.num_masks,
             box=args.box,
             pfm=args.pfm,
+            result_store=result_store,
+            memory=memory,
         )
 
+    report_peak_rss()
+
 if __name__ == "__main__":
     main()
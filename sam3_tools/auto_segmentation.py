@@ -1,48 +1,116 @@
 import os
+import time
 import numpy as np
 import torch
 from PIL import Image
-from datetime import datetime, timezone
 
-from transformers import pipeline
+from .mask_nms import dedupe_masks
+from .models import (
+    apply_performance_settings,
+    get_device,
+    in_background,
+    inference_autocast,
+    is_loaded,
+    load_mask_generator,
+)
 from .shared_utils import (
-    get_unique_path,
-    save_pfm,
+    save_masks,
     load_image_rgb,
+    resize_masks,
 )
 
 
-def run_auto_segmentation(input_path, output_path, num_masks, pfm=False):
+def predict_auto_masks(raw_image, num_masks, dedup_iou=0.7, points_per_batch=None):
+    """
+    Run the mask-generation pipeline and return the num_masks best-scoring
+    masks (masks, scores), dropping near-duplicates above dedup_iou.
+    """
+    if points_per_batch is None:
+        points_per_batch = apply_performance_settings()["points_per_batch"]
+    generator = load_mask_generator()
+
+    with inference_autocast(get_device()):
+        outputs = generator(raw_image, points_per_batch=points_per_batch)
+    masks = outputs["masks"]
+    scores = outputs.get("scores")
+
+    print("Generated masks:", len(masks))
+    keep = dedupe_masks(masks, scores, top_k=num_masks, iou_threshold=dedup_iou)
+    print(f"Kept {len(keep)} after ranking and de-duplication")
+
+    # Only the kept masks are converted at full resolution
+    selected = []
+    for i in keep:
+        m = masks[i]
+        if torch.is_tensor(m):
+            m = m.detach().cpu().numpy()
+        selected.append(np.squeeze(m))
+    if scores is not None:
+        scores = [float(scores[i]) for i in keep]
+    return selected, scores
+
+
+def run_auto_segmentation(
+    input_path,
+    output_path,
+    num_masks,
+    pfm=False,
+    result_store=None,
+    dedup_iou=0.7,
+    memory=None,
+):
+    start = time.perf_counter()
     save_dir = output_path
     base = os.path.splitext(os.path.basename(input_path))[0]
+    os.makedirs(save_dir, exist_ok=True)
+    points_per_batch = apply_performance_settings()["points_per_batch"]
+
+    store_key = None
+    if result_store is not None and os.path.isfile(input_path):
+        store_key = result_store.make_key(
+            input_path, "auto", {"dedup_iou": dedup_iou}, num_masks
+        )
+        cached = result_store.get(store_key)
+        if cached is not None:
+            print("Result store hit")
+            return save_masks(cached[0], save_dir, base, pfm=pfm, scores=cached[1])
+
+    print("Using device:", get_device())
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print("Using device:", device)
+    # Load the pipeline while the image decodes
+    in_background(load_mask_generator)
+
+    plan = None
+    if memory is not None:
+        plan = memory.plan(
+            input_path,
+            "auto",
+            num_masks,
+            model_loaded=is_loaded("auto"),
+            points_per_batch=points_per_batch,
+        )
 
     # Load input
-    rgb, _ = load_image_rgb(input_path)
+    rgb, _ = load_image_rgb(input_path, scale=plan.scale if plan else 1.0, bgr=False)
     if rgb is None:
-        return
+        return None
     raw_image = Image.fromarray(rgb)
+    del rgb
 
-    device_id = 0 if torch.cuda.is_available() else -1  # 0 = first GPU, -1 = CPU
-    generator = pipeline("mask-generation", model="facebook/sam3", device=device_id)
+    if memory is not None:
+        memory.check("inference")
+    selected, scores = predict_auto_masks(
+        raw_image,
+        num_masks,
+        dedup_iou=dedup_iou,
+        points_per_batch=plan.points_per_batch if plan else points_per_batch,
+    )
+    print(f"Time to first mask: {time.perf_counter() - start:.2f}s")
+    if plan is not None and plan.scale < 1.0:
+        selected = resize_masks(selected, (plan.width, plan.height))
+        store_key = None  # upscaled masks must not answer full-resolution requests
 
-    outputs = generator(raw_image, points_per_batch=64)
-    masks = outputs["masks"]
-    scores = outputs.get("scores")
+    if store_key is not None and selected:
+        result_store.put(store_key, selected, scores)
 
-    print("Generated masks:", len(masks))
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-    # Save masks
-    for i, m in enumerate(masks[:num_masks]):
-        if torch.is_tensor(m):
-            m = m.detach().cpu().numpy()
-        seg = np.squeeze(m).astype(np.uint8)
-
-        if pfm:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.pfm")
-            save_pfm(out, seg.astype(np.float32))
-        else:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{i}.png")
-            Image.fromarray(seg * 255).save(out)
+    return save_masks(selected, save_dir, base, pfm=pfm, scores=scores)
@@ -0,0 +1,395 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from PIL import Image
+
+from .auto_segmentation import predict_auto_masks
+from .box_segmentation import clip_box, predict_box_masks
+from .exemplar_segmentation import predict_exemplar_masks
+from .shared_utils import (
+    RAW_EXTENSIONS,
+    hash_file,
+    load_image_rgb,
+    normalize_prompt,
+    resize_masks,
+    save_masks,
+)
+from .memory import in_flight_counts, report_peak_rss
+from .models import (
+    apply_performance_settings,
+    forget_image_encoding,
+    get_device,
+    in_background,
+    is_loaded,
+    load_mask_generator,
+    load_text_model,
+    load_tracker_model,
+)
+from .streaming import run_streaming
+from .text_segmentation import predict_text_masks
+
+
+IMAGE_EXTENSIONS = {
+    ".bmp",
+    ".jpeg",
+    ".jpg",
+    ".png",
+    ".tif",
+    ".tiff",
+    ".webp",
+} | RAW_EXTENSIONS
+
+MANIFEST_NAME = "sam3_manifest.jsonl"
+
+# Which cached model (models.is_loaded kind) each batch mode runs on
+MODEL_KINDS = {"text": "text", "exemplar": "text", "auto": "auto", "box": "tracker"}
+
+
+def prefetch_model(mode):
+    """Start loading the model for mode in the background."""
+    if MODEL_KINDS[mode] == "text":
+        return in_background(load_text_model, get_device())
+    if mode == "auto":
+        return in_background(load_mask_generator)
+    return in_background(load_tracker_model, get_device())
+
+
+# ============================================================
+# Input discovery
+# ============================================================
+def collect_inputs(folder):
+    files = []
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+        if entry.is_file() and Path(entry.name).suffix.lower() in IMAGE_EXTENSIONS:
+            files.append(entry.path)
+    return files
+
+
+# ============================================================
+# Progress manifest (append-only JSONL)
+# ============================================================
+class BatchManifest:
+    """
+    One JSON record per attempt, appended and flushed as soon as an item
+    finishes, so a crash loses at most the item in flight. The latest
+    record for an item key wins when the manifest is replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.latest = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from a crash
+                self.latest[record["key"]] = record
+
+    @staticmethod
+    def item_key(image_hash, mode, params, num_masks, pfm):
+        payload = json.dumps(
+            [image_hash, mode, params, int(num_masks), bool(pfm)],
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.latest.get(key)
+
+    def append(self, record):
+        self.latest[record["key"]] = record
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# ============================================================
+# Batch runner
+# ============================================================
+class _ModeStages:
+    """decode / infer / write callables for one non-interactive mode."""
+
+    def __init__(
+        self,
+        mode,
+        params,
+        num_masks,
+        pfm,
+        output_path,
+        result_store=None,
+        text_cache=None,
+        memory=None,
+    ):
+        self.mode = mode
+        self.params = params
+        self.num_masks = num_masks
+        self.pfm = pfm
+        self.output_path = output_path
+        self.result_store = result_store
+        self.text_cache = text_cache
+        self.memory = memory
+        self.in_flight = (0, 0)  # (images, results) held by the rest of the pipeline
+
+    def decode(self, item):
+        if self.result_store is not None:
+            item["store_key"] = self.result_store.make_key(
+                item["input"],
+                self.mode,
+                self.params,
+                self.num_masks,
+                image_hash=item["hash"],
+            )
+            cached = self.result_store.get(item["store_key"])
+            if cached is not None:
+                return {"cached": cached}
+
+        scale = 1.0
+        if self.memory is not None:
+            item["plan"] = self.memory.plan(
+                item["input"],
+                self.mode,
+                self.num_masks,
+                model_loaded=is_loaded(MODEL_KINDS[self.mode]),
+                points_per_batch=apply_performance_settings()["points_per_batch"],
+                images_in_flight=self.in_flight[0],
+                results_in_flight=self.in_flight[1],
+            )
+            scale = item["plan"].scale
+
+        rgb, _ = load_image_rgb(item["input"], scale=scale, bgr=False)
+        if rgb is None:
+            raise RuntimeError("could not decode image")
+        return {"image": Image.fromarray(rgb)}
+
+    def infer(self, item, decoded):
+        if "cached" in decoded:
+            masks, scores = decoded["cached"]
+            return masks, scores, False
+
+        image = decoded["image"]
+        plan = item.get("plan")
+        if self.memory is not None:
+            self.memory.check("inference")
+        if self.mode == "text":
+            masks, scores = predict_text_masks(
+                image, self.params["prompt"], self.num_masks, text_cache=self.text_cache
+            )
+        elif self.mode == "auto":
+            masks, scores = predict_auto_masks(
+                image,
+                self.num_masks,
+                dedup_iou=self.params["dedup_iou"],
+                points_per_batch=plan.points_per_batch if plan else None,
+            )
+        elif self.mode in ("box", "exemplar"):
+            scale = plan.scale if plan else 1.0
+            box = clip_box([v * scale for v in self.params["box"]], *image.size)
+            if box is None:
+                raise ValueError("box lies outside the image")
+            if self.mode == "box":
+                masks, scores = predict_box_masks(image, box, self.num_masks)
+            else:
+                masks, scores = predict_exemplar_masks(image, box, self.num_masks)
+        else:
+            raise ValueError(f"Mode not supported in batch runs: {self.mode}")
+        return masks, scores, True
+
+    def write(self, item, result):
+        masks, scores, fresh = result
+        plan = item.get("plan")
+        if fresh and plan is not None and plan.scale < 1.0:
+            masks = resize_masks(masks, (plan.width, plan.height))
+            item["store_key"] = None  # upscaled masks must not answer full-resolution requests
+        if fresh and masks and item.get("store_key"):
+            self.result_store.put(item["store_key"], masks, scores)
+        base = os.path.splitext(os.path.basename(item["input"]))[0]
+        return save_masks(masks, self.output_path, base, pfm=self.pfm, scores=scores)
+
+
+def batch_params(mode, prompt=None, box=None, dedup_iou=0.7):
+    if mode == "text":
+        return {"prompt": normalize_prompt(prompt)}
+    if mode in ("box", "exemplar"):
+        x1, y1, x2, y2 = [int(v) for v in box]
+        return {"box": [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]}
+    # Same params as run_auto_segmentation so batch and single runs share store
+    # entries; points_per_batch only changes speed, not the masks
+    return {"dedup_iou": dedup_iou}
+
+
+def run_batch(
+    input_dir,
+    output_path,
+    mode,
+    num_masks,
+    pfm=False,
+    prompt=None,
+    box=None,
+    manifest_path=None,
+    max_attempts=3,
+    retries_per_run=1,
+    retry_failed=False,
+    decode_workers=2,
+    write_workers=2,
+    queue_depth=2,
+    result_store=None,
+    text_cache=None,
+    dedup_iou=0.7,
+    memory=None,
+):
+    """
+    Run one non-interactive mode over every image in input_dir.
+
+    Completed items recorded in the manifest are skipped. A failed item is
+    retried at most retries_per_run times within a run; the rest of its
+    max_attempts (counted across restarts) is left for later runs, so a
+    transient cause can be fixed in between. retry_failed resets the count
+    of items that already used up their attempts. A summary is printed at
+    the end. Decoding, inference and mask writing overlap through
+    run_streaming.
+    """
+    if not output_path:
+        print("Output path is required.")
+        return None
+    if mode in ("box", "exemplar") and box is None:
+        print(f"Batch {mode} mode needs box coordinates (-s x1 y1 x2 y2).")
+        return None
+
+    os.makedirs(output_path, exist_ok=True)
+    apply_performance_settings()
+
+    # The model loads while the manifest is checked and the first images decode
+    prefetch_model(mode)
+    manifest = BatchManifest(manifest_path or os.path.join(output_path, MANIFEST_NAME))
+    params = batch_params(mode, prompt=prompt, box=box, dedup_iou=dedup_iou)
+    stages = _ModeStages(
+        mode, params, num_masks, pfm, output_path, result_store, text_cache, memory
+    )
+
+    inputs = collect_inputs(input_dir)
+    print(f"Batch: {len(inputs)} images, manifest {manifest.path}")
+
+    summary = {"done": 0, "skipped": 0, "failed": 0, "gave_up": 0}
+    batch_start = time.perf_counter()
+
+    pending = []
+    for input_path in inputs:
+        image_hash = hash_file(input_path)
+        key = manifest.item_key(image_hash, mode, params, num_masks, pfm)
+        previous = manifest.get(key)
+
+        if previous and previous["status"] == "done":
+            if all(os.path.exists(p) for p in previous["outputs"]):
+                summary["skipped"] += 1
+                continue
+            print("Outputs missing, re-running", input_path)
+
+        attempts = previous["attempts"] if previous and previous["status"] == "failed" else 0
+        if retry_failed:
+            attempts = 0
+        if attempts >= max_attempts:
+            print(f"Giving up on {input_path} after {attempts} attempts")
+            summary["gave_up"] += 1
+            continue
+
+        pending.append(
+            {
+                "input": input_path,
+                "hash": image_hash,
+                "key": key,
+                "attempts": attempts,
+                "run_attempts": 0,
+            }
+        )
+
+    # Fewer images in flight before lowering the decode scale
+    if memory is not None and pending:
+        decode_workers, write_workers, queue_depth = memory.pipeline(
+            [item["input"] for item in pending],
+            mode,
+            num_masks,
+            decode_workers,
+            write_workers,
+            queue_depth,
+            model_loaded=is_loaded(MODEL_KINDS[mode]),
+            points_per_batch=apply_performance_settings()["points_per_batch"],
+        )
+        stages.in_flight = in_flight_counts(decode_workers, write_workers, queue_depth)
+
+    while pending:
+        retry = []
+
+        def on_done(item, outputs, error, seconds):
+            item["attempts"] += 1
+            item["run_attempts"] += 1
+            if error is None and outputs is None:
+                error = "segmentation returned no result"
+            manifest.append(
+                {
+                    "key": item["key"],
+                    "input": os.path.abspath(item["input"]),
+                    "hash": item["hash"],
+                    "mode": mode,
+                    "params": params,
+                    "num_masks": int(num_masks),
+                    "pfm": bool(pfm),
+                    "status": "failed" if error else "done",
+                    "attempts": item["attempts"],
+                    "outputs": outputs or [],
+                    "seconds": round(seconds, 3),
+                    "error": error,
+                    "finished_at": datetime.now(timezone.utc).isoformat(),
+                }
+            )
+            if not error:
+                summary["done"] += 1
+                print(f"Done {item['input']} in {seconds:.2f}s")
+            elif item["attempts"] >= max_attempts:
+                print(f"Failed {item['input']} for good: {error}")
+                summary["failed"] += 1
+            elif item["run_attempts"] <= retries_per_run:
+                print(f"Failed {item['input']} (attempt {item['attempts']}): {error}")
+                retry.append(item)
+            else:
+                print(
+                    f"Failed {item['input']} (attempt {item['attempts']} of "
+                    f"{max_attempts}), will retry on the next run: {error}"
+                )
+                summary["failed"] += 1
+
+        run_streaming(
+            pending,
+            stages.decode,
+            stages.infer,
+            stages.write,
+            on_done,
+            decode_workers=decode_workers,
+            write_workers=write_workers,
+            queue_depth=queue_depth,
+        )
+        pending = retry
+
+    elapsed = time.perf_counter() - batch_start
+    print(
+        f"Batch finished in {elapsed:.1f}s: {summary['done']} done, "
+        f"{summary['skipped']} already done, {summary['failed']} failed, "
+        f"{summary['gave_up']} over retry limit"
+    )
+    report_peak_rss("Batch")
+    forget_image_encoding()
+    return summary
@@ -1,59 +1,60 @@
 import os
+import time
 import numpy as np
 import cv2
 import torch
 from PIL import Image
-from datetime import datetime, timezone
 
-from transformers import Sam3TrackerProcessor, Sam3TrackerModel
+from .models import (
+    apply_performance_settings,
+    encode_tracker_image,
+    get_device,
+    in_background,
+    inference_autocast,
+    is_loaded,
+    load_tracker_model,
+)
+from .shared_utils import save_masks, load_image_rgb, resize_masks, BoxSelector
 
-from .shared_utils import get_unique_path, save_pfm, load_image_rgb, BoxSelector
 
-
-def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=False):
-    if not input_path or not os.path.exists(input_path):
-        print("Input not found:", input_path)
-        return
-    if not output_path:
-        print("Output path is required.")
-        return
-
-    os.makedirs(output_path, exist_ok=True)
-    save_dir = output_path
-    base = os.path.splitext(os.path.basename(input_path))[0]
-
-    # Load image for box selection
-    rgb, bgr_img = load_image_rgb(input_path)
-    if bgr_img is None:
-        return
-    H, W = bgr_img.shape[:2]
-
-    # Get user box if not provided
-    if box is None:
-        print("Draw selection box...")
-        win = "Box Selection (Enter=OK, R=reset, Esc=cancel)"
-        selector = BoxSelector(bgr_img.copy(), win_name=win)
-
-        cv2.namedWindow(win, cv2.WINDOW_NORMAL)
-        cv2.setMouseCallback(win, selector.mouse_cb)
-
-        while True:
-            cv2.imshow(win, selector.image_bgr)
-            key = cv2.waitKey(20) & 0xFF
-            if key == 13:  # Enter
-                b = selector.get_box()
-                if b:
-                    box = b
-                    break
-            elif key in (ord("r"), ord("R")):
-                selector.reset()
-            elif key == 27:  # Esc
-                cv2.destroyAllWindows()
-                return
-
-        cv2.destroyAllWindows()
-
-    # Normalize + clip box
+def _box_store_key(result_store, input_path, box, num_masks, mode="box"):
+    x1, y1, x2, y2 = [int(v) for v in box]
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    return result_store.make_key(
+        input_path, mode, {"box": [x1, y1, x2, y2]}, num_masks
+    )
+
+
+def select_box(bgr_img):
+    """Let the user draw a box on the image; None if cancelled."""
+    print("Draw selection box...")
+    win = "Box Selection (Enter=OK, R=reset, Esc=cancel)"
+    selector = BoxSelector(bgr_img.copy(), win_name=win)
+
+    cv2.namedWindow(win, cv2.WINDOW_NORMAL)
+    cv2.setMouseCallback(win, selector.mouse_cb)
+
+    box = None
+    while True:
+        cv2.imshow(win, selector.image_bgr)
+        key = cv2.waitKey(20) & 0xFF
+        if key == 13:  # Enter
+            box = selector.get_box()
+            if box:
+                break
+        elif key in (ord("r"), ord("R")):
+            selector.reset()
+        elif key == 27:  # Esc
+            box = None
+            break
+
+    cv2.destroyAllWindows()
+    return box
+
+
+def clip_box(box, W, H):
+    """Sort and clip a box to the image; None if nothing is left."""
     x1, y1, x2, y2 = [int(v) for v in box]
     x1, x2 = sorted((x1, x2))
     y1, y2 = sorted((y1, y2))
@@ -65,20 +66,23 @@ def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=Fal
 
     if x2 <= x1 or y2 <= y1:
         print("Invalid box:", (x1, y1, x2, y2))
-        return
+        return None
+    return x1, y1, x2, y2
 
-    # Build a PIL image from the same pixels used for box selection
-    raw_image = Image.fromarray(rgb)
 
+def predict_box_masks(raw_image, box, num_masks, device=None, image_embeddings=None):
+    """
+    Run the tracker on one clipped box; returns (masks, scores) best first.
+    Pass image_embeddings from encode_tracker_image to skip the image encoder.
+    """
     # Load SAM3 tracker
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if device is None:
+        device = get_device()
     print("Using device:", device)
 
-    model_name = "facebook/sam3"
-    model = Sam3TrackerModel.from_pretrained(model_name).to(device)
-    processor = Sam3TrackerProcessor.from_pretrained(model_name)
+    model, processor = load_tracker_model(device)
 
-    input_boxes = [[[x1, y1, x2, y2]]]
+    input_boxes = [[list(box)]]
 
     inputs = processor(
         images=raw_image,
@@ -86,8 +90,13 @@ def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=Fal
         return_tensors="pt",
     ).to(model.device)
 
-    with torch.inference_mode():
-        outputs = model(**inputs)
+    with torch.inference_mode(), inference_autocast(model.device):
+        if image_embeddings is not None:
+            outputs = model(
+                input_boxes=inputs["input_boxes"], image_embeddings=image_embeddings
+            )
+        else:
+            outputs = model(**inputs)
 
     # Post-process to original image size
     masks = processor.post_process_masks(
@@ -99,7 +108,7 @@ def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=Fal
 
     if masks is None or masks.numel() == 0:
         print("No masks returned.")
-        return
+        return [], None
 
     # Rank by iou_scores if available
     iou = getattr(outputs, "iou_scores", None)
@@ -119,10 +128,11 @@ def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=Fal
             if masks.ndim >= 4
             else list(range(masks.shape[0]))
         )
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
-    # Save up to num_masks
+    # Keep up to num_masks, best first
     count = min(int(num_masks), len(order))
-    for rank, idx in enumerate(order[:count]):
+    selected = []
+    scores = [] if iou is not None else None
+    for idx in order[:count]:
         if masks.ndim == 4:
             m = masks[0, idx]  # object 0, candidate idx
         else:
@@ -130,14 +140,105 @@ def run_box_segmentation(input_path, output_path, num_masks=3, box=None, pfm=Fal
 
         if torch.is_tensor(m):
             m = m.cpu().numpy()
+        selected.append(np.squeeze(m))
+        if scores is not None:
+            scores.append(float(iou_vec[idx]))
+
+    return selected, scores
+
+
+def run_box_segmentation(
+    input_path,
+    output_path,
+    num_masks=3,
+    box=None,
+    pfm=False,
+    result_store=None,
+    memory=None,
+):
+    start = time.perf_counter()
+    if not input_path or not os.path.exists(input_path):
+        print("Input not found:", input_path)
+        return None
+    if not output_path:
+        print("Output path is required.")
+        return None
 
-        seg = np.squeeze(m).astype(np.uint8)  # 0/1
+    os.makedirs(output_path, exist_ok=True)
+    apply_performance_settings()
+    save_dir = output_path
+    base = os.path.splitext(os.path.basename(input_path))[0]
 
-        if pfm:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{rank}.pfm")
-            save_pfm(out, seg.astype(np.float32))
-        else:
-            out = get_unique_path(f"{save_dir}/{base}_{ts}_mask_{rank}.png")
-            Image.fromarray(seg * 255).save(out)
+    # A box given on the command line can be looked up before decoding
+    store_key = None
+    if result_store is not None and box is not None:
+        store_key = _box_store_key(result_store, input_path, box, num_masks)
+        cached = result_store.get(store_key)
+        if cached is not None:
+            print("Result store hit")
+            return save_masks(cached[0], save_dir, base, pfm=pfm, scores=cached[1])
+
+    # Start loading the tracker now; it overlaps decode and box drawing
+    device = get_device()
+    in_background(load_tracker_model, device)
+
+    # Box coordinates are in full-size pixels; the decode may be downscaled
+    plan = None
+    scale = 1.0
+    if memory is not None:
+        plan = memory.plan(input_path, "box", num_masks, model_loaded=is_loaded("tracker"))
+        scale = plan.scale
 
-        print("Saved:", out)
+    # Load image for box selection
+    rgb, bgr_img = load_image_rgb(input_path, scale=scale)
+    if bgr_img is None:
+        return None
+    H, W = bgr_img.shape[:2]
+
+    # Build a PIL image from the same pixels used for box selection and
+    # encode it in the background as soon as the model is ready
+    raw_image = Image.fromarray(rgb)
+    embeddings = in_background(encode_tracker_image, raw_image, device)
+
+    # Get user box if not provided
+    if box is None:
+        box = select_box(bgr_img)
+        if box is None:
+            return None
+        box = [v / scale for v in box]
+
+        if result_store is not None:
+            store_key = _box_store_key(result_store, input_path, box, num_masks)
+            cached = result_store.get(store_key)
+            if cached is not None:
+                print("Result store hit")
+                return save_masks(
+                    cached[0], save_dir, base, pfm=pfm, scores=cached[1]
+                )
+
+    confirmed = time.perf_counter()
+    box = clip_box([v * scale for v in box], W, H)
+    if box is None:
+        return None
+    del rgb, bgr_img
+
+    if memory is not None:
+        memory.check("inference")
+    selected, scores = predict_box_masks(
+        raw_image, box, num_masks, device=device, image_embeddings=embeddings.result()
+    )
+    now = time.perf_counter()
+    print(
+        f"Time to first mask: {now - start:.2f}s "
+        f"({now - confirmed:.2f}s after the box was confirmed)"
+    )
+    if not selected:
+        return []
+    if plan is not None and plan.scale < 1.0:
+        selected = resize_masks(selected, (plan.width, plan.height))
+        store_key = None  # upscaled masks must not answer full-resolution requests
+
+    if store_key is not None:
+        result_store.put(store_key, selected, scores)
+
+    return save_masks(selected, save_dir, base, pfm=pfm, scores=scores)
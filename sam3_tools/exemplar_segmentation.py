@@ -0,0 +1,156 @@
+import os
+import time
+import torch
+from PIL import Image
+
+from .box_segmentation import _box_store_key, clip_box, select_box
+from .models import (
+    apply_performance_settings,
+    get_device,
+    in_background,
+    inference_autocast,
+    is_loaded,
+    load_text_model,
+)
+from .shared_utils import save_masks, load_image_rgb, resize_masks
+
+
+def predict_exemplar_masks(image, box, num_masks, device=None):
+    """
+    Run Sam3Model with one box as a visual exemplar; returns up to num_masks
+    (masks, scores) for every matching instance, best first.
+    """
+    device = device or get_device()
+    model, processor = load_text_model(device)
+
+    # A positive box prompt stands in for the text concept
+    inputs = processor(
+        images=image,
+        input_boxes=[[list(box)]],
+        input_boxes_labels=[[1]],
+        return_tensors="pt",
+    ).to(device)
+
+    with torch.no_grad(), inference_autocast(device):
+        outputs = model(**inputs)
+
+    results = processor.post_process_instance_segmentation(
+        outputs,
+        threshold=0.5,
+        mask_threshold=0.5,
+        target_sizes=inputs.get("original_sizes").tolist(),
+    )[0]
+
+    masks = results["masks"]
+    scores = results["scores"]
+
+    print(f"Found {len(masks)} instances")
+
+    if len(masks) == 0:
+        print("No masks found.")
+        return [], []
+
+    order = torch.argsort(scores.detach().float().cpu(), descending=True)
+    order = order[: min(num_masks, len(order))].tolist()
+    masks = [masks[i].cpu().numpy() for i in order]
+    scores = [float(scores[i]) for i in order]
+    return masks, scores
+
+
+def run_exemplar_segmentation(
+    input_path,
+    output_path,
+    num_masks,
+    box=None,
+    pfm=False,
+    result_store=None,
+    memory=None,
+):
+    """
+    Mask every instance that looks like the object in box, from a single
+    forward pass. Without box coordinates the user draws one.
+    """
+    start = time.perf_counter()
+    if not input_path or not os.path.exists(input_path):
+        print("Input not found:", input_path)
+        return None
+    if not output_path:
+        print("Output path is required.")
+        return None
+
+    os.makedirs(output_path, exist_ok=True)
+    apply_performance_settings()
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+
+    store_key = None
+    if result_store is not None and box is not None:
+        store_key = _box_store_key(
+            result_store, input_path, box, num_masks, mode="exemplar"
+        )
+        cached = result_store.get(store_key)
+        if cached is not None:
+            masks, scores = cached
+            print(f"Result store hit ({len(masks)} masks)")
+            return save_masks(masks, output_path, base_name, pfm=pfm, scores=scores)
+
+    # Load the model while the image decodes and the box is drawn
+    device = get_device()
+    in_background(load_text_model, device)
+
+    # Box coordinates are in full-size pixels; the decode may be downscaled
+    plan = None
+    scale = 1.0
+    if memory is not None:
+        plan = memory.plan(
+            input_path, "exemplar", num_masks, model_loaded=is_loaded("text")
+        )
+        scale = plan.scale
+
+    rgb, bgr_img = load_image_rgb(input_path, scale=scale)
+    if bgr_img is None:
+        return None
+    H, W = bgr_img.shape[:2]
+
+    if box is None:
+        box = select_box(bgr_img)
+        if box is None:
+            return None
+        box = [v / scale for v in box]
+
+        if result_store is not None:
+            store_key = _box_store_key(
+                result_store, input_path, box, num_masks, mode="exemplar"
+            )
+            cached = result_store.get(store_key)
+            if cached is not None:
+                masks, scores = cached
+                print(f"Result store hit ({len(masks)} masks)")
+                return save_masks(
+                    masks, output_path, base_name, pfm=pfm, scores=scores
+                )
+
+    confirmed = time.perf_counter()
+    box = clip_box([v * scale for v in box], W, H)
+    if box is None:
+        return None
+    image = Image.fromarray(rgb)
+    del rgb, bgr_img
+
+    if memory is not None:
+        memory.check("inference")
+    masks, scores = predict_exemplar_masks(image, box, num_masks, device=device)
+    now = time.perf_counter()
+    print(
+        f"Time to first mask: {now - start:.2f}s "
+        f"({now - confirmed:.2f}s after the box was confirmed)"
+    )
+    if not masks:
+        return []
+    if plan is not None and plan.scale < 1.0:
+        masks = resize_masks(masks, (plan.width, plan.height))
+        store_key = None  # upscaled masks must not answer full-resolution requests
+
+    if store_key is not None:
+        result_store.put(store_key, masks, scores)
+
+    return save_masks(masks, output_path, base_name, pfm=pfm, scores=scores)
@@ -6,8 +6,11 @@ from tkinter import filedialog, ttk, messagebox
 
 from .auto_segmentation import run_auto_segmentation
 from .box_segmentation import run_box_segmentation
+from .exemplar_segmentation import run_exemplar_segmentation
 from .point_segmentation import run_point_segmentation
 from .text_segmentation import run_text_segmentation  # NEW
+from .memory import report_peak_rss, reset_peak_rss
+from .models import forget_image_encoding, report_model_memory
 
 
 def start_gui():
@@ -45,7 +48,7 @@ def start_gui():
     tk.Label(root, text="Mode:").grid(row=2, column=0, sticky="w")
     mode_var = tk.StringVar(value="Box")
     mode_cb = ttk.Combobox(
-        root, textvariable=mode_var, values=["Box", "Auto", "Points", "Text"]
+        root, textvariable=mode_var, values=["Box", "Exemplar", "Auto", "Points", "Text"]
     )
 
     mode_cb.grid(row=2, column=1, sticky="w", padx=4, pady=2)
@@ -166,6 +169,7 @@ def start_gui():
         root.update_idletasks()  # ensure label/button update before blocking work
 
         def do_work():
+            reset_peak_rss()
             try:
                 if mode == "Text":
                     run_text_segmentation(inp, out, prompt, n, pfm=save_pfm)
@@ -185,6 +189,8 @@ def start_gui():
                         num_masks=n,
                         pfm=save_pfm,
                     )
+                elif mode == "Exemplar":
+                    run_exemplar_segmentation(inp, out, n, pfm=save_pfm)
                 else:  # Box
                     _call_with_supported_kwargs(
                         run_box_segmentation,
@@ -195,10 +201,15 @@ def start_gui():
                         pfm=save_pfm,
                     )
 
+                report_peak_rss(mode)
+                report_model_memory()
                 _set_running(False, "Done.")
             except Exception as e:
                 _set_running(False, "Failed.")
                 messagebox.showerror("Error", str(e))
+            finally:
+                # The encoding would otherwise hold (V)RAM until the next job
+                forget_image_encoding()
 
         root.after(0, do_work)  # run on Tk main thread
 
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+import torch
+
+
+# Set bits per byte value, for popcount over bit-packed masks
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+# ============================================================
+# Low-resolution, bit-packed mask copies
+# ============================================================
+def downsample_masks(masks, max_side=256):
+    """
+    Area-downsample masks so the longest side is at most max_side.
+    Masks are resized one at a time as uint8, so no batch of full-resolution
+    float copies is ever built. Returns a (N, h, w) bool array.
+    """
+    H, W = masks[0].shape[-2:]
+    scale = min(1.0, max_side / max(H, W))
+    h, w = max(1, round(H * scale)), max(1, round(W * scale))
+
+    out = np.empty((len(masks), h, w), dtype=bool)
+    for i, m in enumerate(masks):
+        m = np.asarray(m.cpu() if torch.is_tensor(m) else m).reshape(H, W)
+        seg = (m > 0).view(np.uint8)
+        cover = cv2.resize(seg * 255, (w, h), interpolation=cv2.INTER_AREA)
+        out[i] = cover >= 128
+        # Keep tiny masks visible instead of letting them vanish
+        if not out[i].any():
+            ys, xs = np.nonzero(seg)
+            out[i, ys * h // H, xs * w // W] = True
+    return out
+
+
+def mask_boxes(low):
+    """(N, h, w) bool → (N, 4) int boxes as x1, y1, x2, y2 (exclusive)."""
+    rows = low.any(axis=2)
+    cols = low.any(axis=1)
+    h, w = low.shape[1:]
+    y1 = rows.argmax(axis=1)
+    y2 = h - rows[:, ::-1].argmax(axis=1)
+    x1 = cols.argmax(axis=1)
+    x2 = w - cols[:, ::-1].argmax(axis=1)
+    return np.stack([x1, y1, x2, y2], axis=1).astype(np.int64)
+
+
+# ============================================================
+# Score-ranked mask NMS
+# ============================================================
+def dedupe_masks(masks, scores=None, top_k=None, iou_threshold=0.7, max_side=256):
+    """
+    Return the indices of the masks to keep, best score first.
+
+    Masks are compared as bit-packed low-resolution copies. For each kept
+    mask, only candidates whose box overlap could still reach
+    iou_threshold get an exact (popcount) mask IoU, and the greedy pass
+    stops as soon as top_k masks are kept.
+    """
+    n = len(masks)
+    if n == 0:
+        return []
+
+    low = downsample_masks(masks, max_side=max_side)
+    packed = np.packbits(low.reshape(n, -1), axis=1)
+    areas = POPCOUNT[packed].sum(axis=1, dtype=np.int64)
+    boxes = mask_boxes(low)
+
+    if scores is None:
+        scores = np.zeros(n)
+    else:
+        scores = np.asarray(
+            scores.detach().cpu() if torch.is_tensor(scores) else scores,
+            dtype=np.float64,
+        )
+    order = np.argsort(-scores, kind="stable")
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for pos, i in enumerate(order):
+        if suppressed[i]:
+            continue
+        keep.append(int(i))
+        if top_k and len(keep) >= top_k:
+            break
+
+        rest = order[pos + 1 :]
+        rest = rest[~suppressed[rest]]
+        if len(rest) == 0:
+            break
+
+        # Upper bound on IoU from boxes: inter <= box overlap, union >= larger area
+        bx = boxes[rest]
+        iw = np.clip(np.minimum(bx[:, 2], boxes[i, 2]) - np.maximum(bx[:, 0], boxes[i, 0]), 0, None)
+        ih = np.clip(np.minimum(bx[:, 3], boxes[i, 3]) - np.maximum(bx[:, 1], boxes[i, 1]), 0, None)
+        bound = iw * ih / np.maximum(np.maximum(areas[rest], areas[i]), 1)
+        cand = rest[bound > iou_threshold]
+        if len(cand) == 0:
+            continue
+
+        inter = POPCOUNT[packed[cand] & packed[i]].sum(axis=1, dtype=np.int64)
+        union = areas[cand] + areas[i] - inter
+        iou = inter / np.maximum(union, 1)
+        suppressed[cand[iou > iou_threshold]] = True
+
+    return keep
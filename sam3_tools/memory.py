@@ -0,0 +1,322 @@
+import gc
+import os
+import platform
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import torch
+
+from .shared_utils import MODEL_NAME, RAW_EXTENSIONS, get_image_size
+
+
+GIB = 1024**3
+MIB = 1024**2
+
+# Rough, deliberately pessimistic per-run costs
+ACTIVATION_BYTES = 1 * GIB  # ViT activations at the 1008 px model input
+DEFAULT_WEIGHT_BYTES = int(3.5 * GIB)  # fp32 SAM3 when the checkpoint size is unknown
+TEXT_CANDIDATES = 32  # text/exemplar-mode masks upsampled by post-processing
+AUTO_CANDIDATES = 256  # auto-mode masks kept by the pipeline before NMS
+SCALES = (1.0, 0.5, 0.25, 0.125)
+MIN_POINTS_PER_BATCH = 8
+
+
+# ============================================================
+# Sizes + RSS
+# ============================================================
+def parse_size(text):
+    """'8G', '512M', '1.5GB' or plain bytes → int bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kmgt]?)i?b?\s*", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid memory size: {text!r}")
+    value, unit = match.groups()
+    power = " kmgt".index(unit.lower() or " ")
+    return int(float(value) * 1024**power)
+
+
+def format_size(num_bytes):
+    if num_bytes is None:
+        return "n/a"
+    return f"{num_bytes / MIB:.0f} MB"
+
+
+def _proc_status(field):
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024  # kB
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_bytes():
+    value = _proc_status("VmRSS")
+    if value is not None:
+        return value
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def peak_rss_bytes():
+    value = _proc_status("VmHWM")
+    if value is not None:
+        return value
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+    except ImportError:  # Windows
+        pass
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        return None
+
+
+def reset_peak_rss():
+    """Restart peak tracking (Linux only; elsewhere the peak is per process)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def report_peak_rss(label="Run"):
+    print(f"{label} peak RSS: {format_size(peak_rss_bytes())}")
+
+
+def model_weight_bytes():
+    try:
+        from huggingface_hub import try_to_load_from_cache
+
+        path = try_to_load_from_cache(MODEL_NAME, "model.safetensors")
+    except Exception:
+        path = None
+    if isinstance(path, str) and os.path.isfile(path):
+        return os.path.getsize(path)
+    return DEFAULT_WEIGHT_BYTES
+
+
+# ============================================================
+# Budget governor
+# ============================================================
+@dataclass
+class MemoryPlan:
+    width: int
+    height: int
+    scale: float = 1.0
+    points_per_batch: int = 64
+    estimate: int = 0
+
+
+class MemoryGovernor:
+    """
+    Picks settings for a run under a byte budget. Auto mode first tries a
+    smaller points_per_batch (slower, same result); after that the decode
+    scale is lowered. Masks are written back at full size afterwards.
+    Batch runs first shrink their pipeline (see pipeline()).
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+
+    def _base(self, model_loaded):
+        base = current_rss_bytes() or 0
+        if not model_loaded:
+            base += model_weight_bytes()
+        return base
+
+    @staticmethod
+    def estimate(mode, width, height, scale, num_masks, points_per_batch, is_raw):
+        full = width * height
+        pixels = full * scale * scale
+        total = pixels * 3  # RGB
+        if is_raw:
+            total += full * 2  # 16-bit sensor data stays full size
+        total += ACTIVATION_BYTES
+
+        if mode in ("text", "exemplar"):
+            total += max(num_masks, TEXT_CANDIDATES) * pixels * 4  # float upsampling
+        elif mode == "auto":
+            total += points_per_batch * 3 * pixels * 4  # per-batch float upsampling
+            total += AUTO_CANDIDATES * pixels  # bool masks kept by the pipeline
+        else:
+            total += 3 * pixels * 4
+
+        total += num_masks * full  # final masks at full size
+        return int(total)
+
+    @staticmethod
+    def in_flight(width, height, scale, num_masks, images, results, is_raw):
+        """Other decoded images and finished results a batch pipeline holds."""
+        full = width * height
+        per_image = full * scale * scale * 3
+        if is_raw:
+            per_image += full * 2
+        per_result = num_masks * full * 2  # decode-size and full-size masks while writing
+        return int(images * per_image + results * per_result)
+
+    def plan(
+        self,
+        input_path,
+        mode,
+        num_masks,
+        model_loaded=False,
+        points_per_batch=64,
+        images_in_flight=0,
+        results_in_flight=0,
+    ):
+        try:
+            width, height = get_image_size(input_path)
+        except Exception:
+            # Unreadable; leave it to the decode to report the failure
+            return MemoryPlan(0, 0, 1.0, points_per_batch)
+        is_raw = Path(input_path).suffix.lower() in RAW_EXTENSIONS
+        base = self._base(model_loaded)
+
+        batches = [points_per_batch]
+        while mode == "auto" and batches[-1] // 2 >= MIN_POINTS_PER_BATCH:
+            batches.append(batches[-1] // 2)
+
+        best = None
+        for scale in SCALES:
+            for ppb in batches:
+                est = base + self.estimate(
+                    mode, width, height, scale, num_masks, ppb, is_raw
+                )
+                est += self.in_flight(
+                    width,
+                    height,
+                    scale,
+                    num_masks,
+                    images_in_flight,
+                    results_in_flight,
+                    is_raw,
+                )
+                best = MemoryPlan(width, height, scale, ppb, est)
+                if est <= self.budget:
+                    break
+            if best.estimate <= self.budget:
+                break
+
+        if best.estimate > self.budget:
+            print(
+                f"Memory: estimate {format_size(best.estimate)} still exceeds the "
+                f"{format_size(self.budget)} budget at the cheapest settings"
+            )
+        elif best.scale < 1.0 or best.points_per_batch < points_per_batch:
+            print(
+                f"Memory: budget {format_size(self.budget)}, working at scale "
+                f"{best.scale:g}, points_per_batch {best.points_per_batch} "
+                f"(estimate {format_size(best.estimate)})"
+            )
+        return best
+
+    def pipeline(
+        self,
+        input_paths,
+        mode,
+        num_masks,
+        decode_workers,
+        write_workers,
+        queue_depth,
+        model_loaded=False,
+        points_per_batch=64,
+    ):
+        """
+        Shrink a batch pipeline until its largest image fits the budget at
+        full scale with the rest of the pipeline in flight: queue_depth
+        first, then decode_workers, then write_workers. Per-image plans
+        lower the scale if even one of each does not fit.
+        Returns (decode_workers, write_workers, queue_depth).
+        """
+        if not input_paths:
+            return decode_workers, write_workers, queue_depth
+
+        sizes = {}
+        for path in input_paths:
+            try:
+                sizes[path] = get_image_size(path)
+            except Exception:
+                continue  # fails again, and is recorded, when the item decodes
+        if not sizes:
+            return decode_workers, write_workers, queue_depth
+        path = max(sizes, key=lambda p: sizes[p][0] * sizes[p][1])
+        width, height = sizes[path]
+        is_raw = Path(path).suffix.lower() in RAW_EXTENSIONS
+        base = self._base(model_loaded) + self.estimate(
+            mode,
+            width,
+            height,
+            1.0,
+            num_masks,
+            MIN_POINTS_PER_BATCH if mode == "auto" else points_per_batch,
+            is_raw,
+        )
+
+        requested = (decode_workers, write_workers, queue_depth)
+        while True:
+            images, results = in_flight_counts(decode_workers, write_workers, queue_depth)
+            est = base + self.in_flight(
+                width, height, 1.0, num_masks, images, results, is_raw
+            )
+            if est <= self.budget:
+                break
+            if queue_depth > 1:
+                queue_depth -= 1
+            elif decode_workers > 1:
+                decode_workers -= 1
+            elif write_workers > 1:
+                write_workers -= 1
+            else:
+                break
+
+        if (decode_workers, write_workers, queue_depth) != requested:
+            print(
+                f"Memory: budget {format_size(self.budget)}, batch pipeline reduced "
+                f"to {decode_workers} decode / {write_workers} write worker(s), "
+                f"queue depth {queue_depth}"
+            )
+        return decode_workers, write_workers, queue_depth
+
+    def check(self, stage):
+        """
+        Before a heavy stage: if RSS is over budget, collect garbage and
+        return cached CUDA blocks, then report what is still in use.
+        """
+        rss = current_rss_bytes()
+        if rss is None or rss <= self.budget:
+            return rss
+
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        after = current_rss_bytes()
+        print(
+            f"Memory: {format_size(rss)} in use before {stage}, over the "
+            f"{format_size(self.budget)} budget; {format_size(after)} after "
+            f"releasing cached memory"
+        )
+        return after
+
+
+def in_flight_counts(decode_workers, write_workers, queue_depth):
+    """
+    Images and results a run_streaming pipeline holds besides the image
+    being inferred: each decoder may hold one image and each queue holds
+    queue_depth items; each writer holds one result.
+    """
+    images = decode_workers + queue_depth
+    results = queue_depth + write_workers
+    return images, results
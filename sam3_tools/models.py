@@ -0,0 +1,368 @@
+import contextlib
+import threading
+from concurrent.futures import Future
+
+import torch
+from torch import nn
+from transformers import (
+    Sam3Model,
+    Sam3Processor,
+    Sam3TrackerModel,
+    Sam3TrackerProcessor,
+    pipeline,
+)
+
+from .shared_utils import MODEL_NAME, get_performance_settings
+
+
+# ============================================================
+# Process-wide model cache
+# ============================================================
+# Loading SAM3 dominates a single run, so every entry point goes through
+# these helpers and a long-lived process (GUI, batch) only pays it once.
+# Each model has its own lock so different models can load in parallel,
+# and a caller asking for a model that is still loading simply waits.
+_lock = threading.Lock()
+_key_locks = {}
+_loaded = {}
+
+
+def get_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# ============================================================
+# Tuned performance settings (written by --tune)
+# ============================================================
+_performance = None
+
+
+def apply_performance_settings(reload=False):
+    """Read the config once per process and apply the torch thread count."""
+    global _performance
+    if _performance is None or reload:
+        _performance = get_performance_settings()
+        threads = _performance.get("torch_threads")
+        if threads and torch.get_num_threads() != int(threads):
+            torch.set_num_threads(int(threads))
+    return _performance
+
+
+def inference_autocast(device):
+    """Autocast context for the tuned precision, if it was tuned for this device type."""
+    perf = apply_performance_settings()
+    precision = perf.get("precision") or "float32"
+    device_type = torch.device(device).type
+    if precision == "float32" or perf.get("device") != device_type:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device_type, dtype=getattr(torch, precision))
+
+
+def _get_or_load(key, loader):
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        if key not in _loaded:
+            _loaded[key] = loader()
+        return _loaded[key]
+
+
+def in_background(func, *args, **kwargs):
+    """
+    Run func on a daemon thread and return its Future, e.g. to load a model
+    while the image decodes or the user is still drawing. Daemon threads
+    let the process exit right away when a run ends early (Esc, result
+    store hit, unreadable image) instead of waiting for the load.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name="sam3-load", daemon=True).start()
+    return future
+
+
+# ============================================================
+# Shared vision backbone
+# ============================================================
+class SharedBackbone(nn.Module):
+    """
+    The SAM3 ViT backbone shared by the text model, the tracker and the
+    mask-generation pipeline. It also remembers its output for the last
+    image it encoded, so requests on the same image within one job reuse
+    one encoding; forget_image_encoding() drops it when the job ends.
+    """
+
+    def __init__(self, backbone):
+        super().__init__()
+        self.backbone = backbone
+        self.hits = 0
+        self.misses = 0
+        self._last_key = None
+        self._last_input = None
+        self._last_output = None
+        self._memo_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(super().__getattr__("backbone"), name)
+
+    def forward(self, pixel_values, *args, **kwargs):
+        if torch.is_grad_enabled() or any(torch.is_tensor(v) for v in kwargs.values()):
+            return self.backbone(pixel_values, *args, **kwargs)
+
+        try:
+            autocast = torch.is_autocast_enabled(pixel_values.device.type)
+        except TypeError:  # torch < 2.4
+            autocast = torch.is_autocast_enabled()
+        key = (
+            tuple(pixel_values.shape),
+            pixel_values.dtype,
+            pixel_values.device,
+            autocast,
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        with self._memo_lock:
+            if key == self._last_key and torch.equal(pixel_values, self._last_input):
+                self.hits += 1
+                return self._last_output
+
+            output = self.backbone(pixel_values, *args, **kwargs)
+            self.misses += 1
+            self._last_key = key
+            self._last_input = pixel_values
+            self._last_output = output
+            return output
+
+    def forget(self):
+        with self._memo_lock:
+            self._last_key = self._last_input = self._last_output = None
+
+
+# Sam3Model and Sam3TrackerModel both take their ViT from the checkpoint's
+# detector_model.vision_encoder.backbone.* tensors, so for one checkpoint
+# the backbone only has to be read once.
+BACKBONE_KEYS = r"vision_encoder\.backbone\."
+
+_shared_backbone = None
+_backbone_lock = threading.Lock()
+_bytes_shared = 0
+
+
+def _param_bytes(module):
+    return sum(p.numel() * p.element_size() for p in module.parameters())
+
+
+class _BackbonePlaceholder(nn.Module):
+    """Parameter-free stand-in for the ViT while a model loads."""
+
+    def forward(self, *args, **kwargs):
+        raise RuntimeError("Shared vision backbone was not attached")
+
+
+def _without_backbone(model_cls):
+    """
+    Subclass of model_cls that builds without a ViT and ignores the
+    checkpoint's backbone tensors, so from_pretrained never reads them.
+    """
+
+    def __init__(self, config):
+        model_cls.__init__(self, config)
+        self.vision_encoder.backbone = _BackbonePlaceholder()
+
+    ignore = list(model_cls._keys_to_ignore_on_load_unexpected or [])
+    return type(
+        model_cls.__name__,
+        (model_cls,),
+        {
+            "__init__": __init__,
+            "__module__": model_cls.__module__,
+            "_keys_to_ignore_on_load_unexpected": ignore + [BACKBONE_KEYS],
+        },
+    )
+
+
+def _on_device(module, device):
+    param = next(module.parameters(), None)
+    if param is None:
+        return True
+    device = torch.device(device)
+    return param.device.type == device.type and device.index in (None, param.device.index)
+
+
+def _attach_shared_backbone(model):
+    """
+    Point model.vision_encoder.backbone at the process-wide SharedBackbone.
+    The first model provides it; a later fully loaded model (all from the
+    same checkpoint) on the same device swaps its own copy out so it can
+    be freed. A model on another device keeps its own backbone.
+    """
+    global _shared_backbone, _bytes_shared
+    encoder = getattr(model, "vision_encoder", None)
+    backbone = getattr(encoder, "backbone", None)
+    if backbone is None or isinstance(backbone, SharedBackbone):
+        return
+
+    with _lock:
+        if _shared_backbone is None:
+            _shared_backbone = SharedBackbone(backbone)
+            encoder.backbone = _shared_backbone
+            return
+        shared = _shared_backbone
+
+    if not _on_device(shared, model.device):
+        if isinstance(backbone, _BackbonePlaceholder):
+            raise RuntimeError("Shared vision backbone is on another device")
+        print(f"Vision backbone not shared: {model.device} differs from the shared copy")
+        return
+
+    if isinstance(backbone, _BackbonePlaceholder):
+        saved = _param_bytes(shared)
+        print(f"Shared vision backbone: skipped loading {saved / 1024**2:.0f} MB of weights")
+    else:
+        saved = _param_bytes(backbone)
+        print(f"Shared vision backbone: {saved / 1024**2:.0f} MB of duplicate weights released")
+    encoder.backbone = shared
+    with _lock:
+        _bytes_shared += saved
+
+
+def _load_model(model_cls, device):
+    """
+    from_pretrained for SAM3 models that share one vision backbone. The
+    first model loads in full; later ones skip the backbone entirely.
+    """
+    with _backbone_lock:
+        shared = _shared_backbone
+        if shared is None:
+            model = model_cls.from_pretrained(MODEL_NAME).to(device)
+            _attach_shared_backbone(model)
+            return model
+
+    loader = model_cls
+    if _on_device(shared, device):
+        loader = _without_backbone(model_cls)
+    model = loader.from_pretrained(MODEL_NAME).to(device)
+    _attach_shared_backbone(model)
+    return model
+
+
+def forget_image_encoding():
+    """Drop the memoized image encoding, e.g. once a GUI job is done."""
+    if _shared_backbone is not None:
+        _shared_backbone.forget()
+
+
+def model_memory_report():
+    """
+    Parameter memory of the loaded models, counting shared tensors once,
+    next to what separate copies would take.
+    """
+    with _lock:
+        models = []
+        for key, value in _loaded.items():
+            model = value[0] if isinstance(value, tuple) else value.model
+            models.append((key[0], model))
+
+    seen = set()
+    unique = 0
+    for _, model in models:
+        for p in model.parameters():
+            if p.data_ptr() not in seen:
+                seen.add(p.data_ptr())
+                unique += p.numel() * p.element_size()
+
+    return {
+        "models": [kind for kind, _ in models],
+        "bytes": unique,
+        "bytes_without_sharing": unique + _bytes_shared,
+        "bytes_saved": _bytes_shared,
+        "encoder_hits": _shared_backbone.hits if _shared_backbone else 0,
+        "encoder_misses": _shared_backbone.misses if _shared_backbone else 0,
+    }
+
+
+def report_model_memory():
+    report = model_memory_report()
+    if not report["models"]:
+        return
+    mb = 1024**2
+    print(
+        f"Model weights: {report['bytes'] / mb:.0f} MB for {', '.join(report['models'])} "
+        f"({report['bytes_saved'] / mb:.0f} MB saved by sharing); image encoder "
+        f"reused {report['encoder_hits']} of "
+        f"{report['encoder_hits'] + report['encoder_misses']} times"
+    )
+
+
+def load_text_model(device=None):
+    """Sam3Model + Sam3Processor (text prompts)."""
+    device = str(device or get_device())
+
+    def _load():
+        model = _load_model(Sam3Model, device)
+        processor = Sam3Processor.from_pretrained(MODEL_NAME)
+        return model, processor
+
+    return _get_or_load(("text", device), _load)
+
+
+def load_tracker_model(device=None):
+    """Sam3TrackerModel + Sam3TrackerProcessor (box and point prompts)."""
+    device = str(device or get_device())
+
+    def _load():
+        model = _load_model(Sam3TrackerModel, device)
+        processor = Sam3TrackerProcessor.from_pretrained(MODEL_NAME)
+        return model, processor
+
+    return _get_or_load(("tracker", device), _load)
+
+
+def load_mask_generator():
+    """
+    transformers mask-generation pipeline (auto mode), built on the shared
+    tracker model so auto, box and point mode hold one set of weights.
+    """
+    device_id = 0 if torch.cuda.is_available() else -1  # 0 = first GPU, -1 = CPU
+
+    def _load():
+        model, processor = load_tracker_model(get_device())
+        try:
+            return pipeline(
+                "mask-generation",
+                model=model,
+                image_processor=processor.image_processor,
+                device=device_id,
+            )
+        except Exception as exc:
+            print("Loading a separate mask-generation model:", exc)
+            generator = pipeline("mask-generation", model=MODEL_NAME, device=device_id)
+            _attach_shared_backbone(generator.model)
+            return generator
+
+    return _get_or_load(("auto", device_id), _load)
+
+
+def encode_tracker_image(raw_image, device=None):
+    """Image embeddings for Sam3TrackerModel, reusable across box/point prompts."""
+    model, processor = load_tracker_model(device)
+    inputs = processor(images=raw_image, return_tensors="pt").to(model.device)
+    with torch.inference_mode(), inference_autocast(model.device):
+        return model.get_image_embeddings(inputs["pixel_values"])
+
+
+def is_loaded(kind):
+    """kind is "text", "tracker" or "auto"."""
+    with _lock:
+        return any(key[0] == kind for key in _loaded)
+
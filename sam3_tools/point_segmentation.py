@@ -1,15 +1,20 @@
 import os
+import time
 import numpy as np
 import cv2
 import torch
 from PIL import Image
-from datetime import datetime, timezone
 
-from transformers import Sam3TrackerProcessor, Sam3TrackerModel
-from accelerate import Accelerator
+from .models import (
+    apply_performance_settings,
+    encode_tracker_image,
+    get_device,
+    in_background,
+    inference_autocast,
+    load_tracker_model,
+)
 from .shared_utils import (
-    get_unique_path,
-    save_pfm,
+    save_masks,
     load_image_rgb,
 )
 
@@ -18,13 +23,16 @@ from .shared_utils import (
 # Point Selector (interactive point mode)
 # ============================================================
 class PointSelector:
-    def __init__(self, img_bgr, model, processor, raw_image):
+    def __init__(self, img_bgr, raw_image, device, embeddings):
         self.clone = img_bgr.copy()
         self.image_bgr = img_bgr.copy()
 
-        self.model = model
-        self.processor = processor
+        # The model and image embeddings may still be loading in the
+        # background; the first click waits for them
+        self.device = device
+        self.embeddings = embeddings  # Future from encode_tracker_image
         self.raw_image = raw_image
+        self.first_mask_at = None
         self.points_pos = []  # left-click = foreground
         self.points_neg = []  # right-click = background
 
@@ -66,18 +74,26 @@ class PointSelector:
         input_points = [[all_pts]]
         input_labels = [[labels]]
 
-        inputs = self.processor(
+        model, processor = load_tracker_model(self.device)
+        image_embeddings = self.embeddings.result()
+
+        inputs = processor(
             images=self.raw_image,
             input_points=input_points,
             input_labels=input_labels,
             return_tensors="pt",
-        ).to(self.model.device)
+        ).to(model.device)
 
-        with torch.inference_mode():
-            outputs = self.model(**inputs)
+        # The image was encoded once; each click only runs the prompt decoder
+        with torch.inference_mode(), inference_autocast(model.device):
+            outputs = model(
+                input_points=inputs["input_points"],
+                input_labels=inputs["input_labels"],
+                image_embeddings=image_embeddings,
+            )
 
         # masks: [num_objects, num_masks, H, W] for the first (and only) image
-        masks = self.processor.post_process_masks(
+        masks = processor.post_process_masks(
             outputs.pred_masks.cpu(),
             inputs["original_sizes"],
         )[0]
@@ -101,6 +117,8 @@ class PointSelector:
             best_mask = best_mask.cpu().numpy()
 
         self.current_mask = best_mask
+        if self.first_mask_at is None:
+            self.first_mask_at = time.perf_counter()
         self.render_preview()
 
     # ------------------------------------------------------------------
@@ -132,32 +150,35 @@ def run_point_segmentation(
     num_masks=1,
     pfm=False,
 ):
+    start = time.perf_counter()
+
     # Prepare output directories
     if not os.path.exists(input_path):
         print("Input not found:", input_path)
         return
 
     os.makedirs(output_path, exist_ok=True)
+    apply_performance_settings()
 
     save_dir = output_path
     base = os.path.splitext(os.path.basename(input_path))[0]
 
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = get_device()
     print("Using device:", device)
 
-    device = Accelerator().device
-    model = Sam3TrackerModel.from_pretrained("facebook/sam3").to(device)
-    processor = Sam3TrackerProcessor.from_pretrained("facebook/sam3")
+    # Load the tracker in the background while the image decodes
+    in_background(load_tracker_model, device)
 
     # Load image
     rgb, bgr_img = load_image_rgb(input_path)
     if bgr_img is None:
         return
     raw_image = Image.fromarray(rgb)
+    embeddings = in_background(encode_tracker_image, raw_image, device)
 
     # Create selector interface
     win = "Left Click=Positive, Right/Middle Click=Negative, Enter=Confirm, R=Reset, Esc=Cancel"
-    selector = PointSelector(bgr_img, model, processor, raw_image)
+    selector = PointSelector(bgr_img, raw_image, device, embeddings)
 
     cv2.namedWindow(win, cv2.WINDOW_NORMAL)
     cv2.setMouseCallback(win, selector.mouse_cb)
@@ -180,19 +201,11 @@ def run_point_segmentation(
             return
 
     cv2.destroyAllWindows()
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+    if selector.first_mask_at is not None:
+        print(f"Time to first mask: {selector.first_mask_at - start:.2f}s")
     if final_mask is None:
         print("No mask generated.")
-        return
+        return []
 
     # Save final mask
-    mask = final_mask.squeeze().astype(np.uint8) * 255
-
-    if pfm:
-        out = get_unique_path(f"{save_dir}/{base}_{ts}_mask.pfm")
-        save_pfm(out, final_mask.squeeze())  # PFM uses float mask, not 0–255
-    else:
-        out = get_unique_path(f"{save_dir}/{base}_{ts}_mask.png")
-        Image.fromarray(mask).save(out)
-
-    print("Saved:", out)
+    return save_masks([final_mask], save_dir, base, pfm=pfm, single=True)
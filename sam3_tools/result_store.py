@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from .shared_utils import get_cache_dir, get_model_revision, hash_file
+
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GiB
+
+
+# ============================================================
+# Content-addressed result store
+# ============================================================
+class ResultStore:
+    """
+    On-disk store of finished mask sets. Keys are built from the image
+    content hash, the mode, the normalized prompt parameters, num_masks and
+    the model revision, so an identical request can be answered without
+    decoding the image or loading the model.
+
+    Masks are bit-packed and compressed; least recently used entries are
+    evicted once the store grows past max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or os.path.join(get_cache_dir(), "results")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def make_key(
+        self, input_path, mode, params, num_masks, revision=None, image_hash=None
+    ):
+        payload = {
+            "image": image_hash or hash_file(input_path),
+            "mode": mode,
+            "params": params,
+            "num_masks": int(num_masks),
+            "revision": revision or get_model_revision(),
+        }
+        blob = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.npz")
+
+    def get(self, key):
+        """Return (masks, scores) for a stored key, or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                shape = tuple(data["shape"])
+                count = int(np.prod(shape))
+                masks = np.unpackbits(data["packed"], count=count).reshape(shape)
+                scores = data["scores"].tolist() if "scores" in data else None
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used for eviction
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return masks.astype(bool), scores
+
+    def put(self, key, masks, scores=None):
+        masks = np.stack([np.squeeze(np.asarray(m)) > 0 for m in masks])
+        arrays = {
+            "packed": np.packbits(masks.ravel()),
+            "shape": np.asarray(masks.shape, dtype=np.int64),
+        }
+        if scores is not None:
+            arrays["scores"] = np.asarray(scores, dtype=np.float32)
+
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        try:
+            np.savez_compressed(tmp, **arrays)
+            os.replace(tmp, path)
+        except OSError as exc:
+            print("Could not write result store entry:", exc)
+            try:
+                os.remove(tmp)  # evict() skips temp files, so nothing else would
+            except OSError:
+                pass
+            return
+
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.root):
+                if not entry.name.endswith(".npz") or ".tmp" in entry.name:
+                    continue
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+_shared_store = None
+
+
+def get_result_store(max_bytes=DEFAULT_MAX_BYTES):
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = ResultStore(max_bytes=max_bytes)
+    return _shared_store
@@ -1,5 +1,9 @@
+import copy
+import hashlib
+import json
 import os
 import platform
+from datetime import datetime, timezone
 from pathlib import Path
 import numpy as np
 
@@ -43,6 +47,40 @@ RAW_EXTENSIONS = {
     ".x3f",
 }
 
+MODEL_NAME = "facebook/sam3"
+
+
+# ============================================================
+# Model revision + cache locations
+# ============================================================
+def get_model_revision(model_name=MODEL_NAME):
+    """Commit hash of the locally cached checkpoint, or "unknown"."""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+
+        path = try_to_load_from_cache(model_name, "config.json")
+    except Exception:
+        path = None
+
+    if isinstance(path, str):
+        # .../models--facebook--sam3/snapshots/<commit>/config.json
+        return os.path.basename(os.path.dirname(path))
+    return "unknown"
+
+
+def get_cache_dir():
+    system = platform.system()
+    if system == "Windows":
+        root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+        path = os.path.join(root, "sam3-tools", "Cache")
+    elif system == "Darwin":
+        path = os.path.expanduser("~/Library/Caches/sam3-tools")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+        path = os.path.join(root, "sam3-tools")
+    os.makedirs(path, exist_ok=True)
+    return path
+
 
 # ============================================================
 # Unique filename generator
@@ -57,6 +95,97 @@ def get_unique_path(path):
     return new_path
 
 
+# ============================================================
+# Config file
+# ============================================================
+DEFAULT_CONFIG = {
+    "performance": {
+        "torch_threads": None,
+        "precision": "float32",
+        "points_per_batch": 64,
+    },
+}
+
+
+def get_config_path():
+    system = platform.system()
+    if system == "Windows":
+        root = os.environ.get("APPDATA", os.path.expanduser("~"))
+        return os.path.join(root, "sam3-tools", "config.json")
+    if system == "Darwin":
+        return os.path.expanduser(
+            "~/Library/Application Support/sam3-tools/config.json"
+        )
+    root = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    return os.path.join(root, "sam3-tools", "config.json")
+
+
+def _with_defaults(cfg):
+    for section, values in DEFAULT_CONFIG.items():
+        cfg.setdefault(section, {})
+        for key, value in values.items():
+            cfg[section].setdefault(key, value)
+    return cfg
+
+
+def load_config():
+    path = get_config_path()
+    if not os.path.isfile(path):
+        return copy.deepcopy(DEFAULT_CONFIG)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return _with_defaults(json.load(f))
+    except (OSError, ValueError) as exc:
+        print("Could not read config, using defaults:", exc)
+        return copy.deepcopy(DEFAULT_CONFIG)
+
+
+def save_config(cfg):
+    path = get_config_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_or_create_config():
+    if not os.path.isfile(get_config_path()):
+        save_config(copy.deepcopy(DEFAULT_CONFIG))
+    return load_config()
+
+
+def machine_fingerprint():
+    return "|".join(
+        [platform.node(), platform.system(), platform.machine(), str(os.cpu_count())]
+    )
+
+
+def get_performance_settings():
+    """Tuned settings for this machine, or the defaults."""
+    perf = load_config()["performance"]
+    tuned_for = perf.get("machine")
+    if tuned_for and tuned_for != machine_fingerprint():
+        print("Performance settings were tuned on another machine; run --tune here.")
+        return dict(DEFAULT_CONFIG["performance"])
+    return perf
+
+
+# ============================================================
+# Request normalization + hashing
+# ============================================================
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 # ============================================================
 # Save PFM files
 # ============================================================
@@ -78,10 +207,45 @@ def save_pfm(path, image, scale=1.0):
         image.tofile(f)
 
 
+# ============================================================
+# Save masks (shared by every mode)
+# ============================================================
+def save_masks(masks, save_dir, base, pfm=False, scores=None, single=False):
+    """
+    Write binary masks as PNG (0/255) or PFM (0.0/1.0) and return the paths.
+    single=True keeps the point-mode naming (no mask index).
+    """
+    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+    ext = ".pfm" if pfm else ".png"
+    paths = []
+
+    for i, m in enumerate(masks):
+        seg = (np.squeeze(np.asarray(m)) > 0).astype(np.uint8)  # 0/1
+        name = f"{base}_{ts}_mask" if single else f"{base}_{ts}_mask_{i}"
+        out = get_unique_path(os.path.join(save_dir, name + ext))
+
+        if pfm:
+            save_pfm(out, seg.astype(np.float32))
+        else:
+            Image.fromarray(seg * 255).save(out)
+
+        if scores is not None:
+            print(f"Saved mask {i} (score={scores[i]:.4f}) → {out}")
+        else:
+            print("Saved:", out)
+        paths.append(out)
+
+    return paths
+
+
 # ============================================================
 # Image loading
 # ============================================================
-def load_image_rgb(path):
+def load_image_rgb(path, scale=1.0, bgr=True):
+    """
+    Decode an image (RAW or anything Pillow reads) to RGB, optionally
+    downscaled by `scale`. The BGR copy is only built when bgr=True.
+    """
     if not os.path.isfile(path):
         print("Input not found:", path)
         return None, None
@@ -90,15 +254,53 @@ def load_image_rgb(path):
     try:
         if ext in RAW_EXTENSIONS:
             with rawpy.imread(path) as raw:
-                rgb = raw.postprocess()
+                # half_size skips demosaicing work and halves both sides
+                half = scale <= 0.5
+                rgb = raw.postprocess(half_size=half)
+            remaining = scale * 2 if half else scale
         else:
-            rgb = np.array(Image.open(path).convert("RGB"))
+            with Image.open(path) as img:
+                full_width = img.width
+                if scale < 1.0:
+                    # JPEG can decode directly at 1/2, 1/4, 1/8
+                    img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+                remaining = scale * full_width / img.width
+                rgb = np.array(img.convert("RGB"))
+        if remaining < 0.999:
+            h, w = rgb.shape[:2]
+            size = (max(1, round(w * remaining)), max(1, round(h * remaining)))
+            rgb = cv2.resize(rgb, size, interpolation=cv2.INTER_AREA)
     except Exception as exc:
         print("Failed to load image:", exc)
         return None, None
 
-    bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
-    return rgb, bgr
+    if not bgr:
+        return rgb, None
+    return rgb, cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+
+
+def get_image_size(path):
+    """(width, height) of the decoded image without decoding pixels."""
+    ext = Path(path).suffix.lower()
+    if ext in RAW_EXTENSIONS:
+        with rawpy.imread(path) as raw:
+            sizes = raw.sizes
+            if sizes.flip in (5, 6):  # rotated 90°
+                return sizes.height, sizes.width
+            return sizes.width, sizes.height
+    with Image.open(path) as img:
+        return img.size
+
+
+def resize_masks(masks, size):
+    """Nearest-neighbour resize of binary masks to size=(width, height)."""
+    out = []
+    for m in masks:
+        seg = (np.squeeze(np.asarray(m)) > 0).astype(np.uint8)
+        if (seg.shape[1], seg.shape[0]) != tuple(size):
+            seg = cv2.resize(seg, tuple(size), interpolation=cv2.INTER_NEAREST)
+        out.append(seg.astype(bool))
+    return out
 
 
 # ============================================================
@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from collections import defaultdict
+
+
+_DONE = object()
+
+
+# ============================================================
+# Per-stage timing
+# ============================================================
+class StageStats:
+    def __init__(self):
+        self.busy = defaultdict(float)
+        self.count = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] += seconds
+            self.count[stage] += 1
+
+    def report(self, wall, workers, items):
+        print(f"Pipeline: {items} images in {wall:.1f}s ({items / wall if wall else 0:.2f} img/s)")
+        for stage in ("decode", "infer", "write"):
+            capacity = wall * workers[stage]
+            util = self.busy[stage] / capacity if capacity else 0.0
+            print(
+                f"  {stage:<6} {self.busy[stage]:7.1f}s busy over "
+                f"{workers[stage]} worker(s), {util:.0%} utilized"
+            )
+
+
+# ============================================================
+# Decode → inference → write pipeline
+# ============================================================
+def run_streaming(
+    items,
+    decode,
+    infer,
+    write,
+    on_done,
+    decode_workers=2,
+    write_workers=2,
+    queue_depth=2,
+):
+    """
+    Overlap the three stages of a multi-image run.
+
+    decode(item) runs on prefetch threads, infer(item, decoded) on the
+    calling thread (the one that owns the model), and write(item, result) on
+    a writer pool. Bounded queues of queue_depth between stages cap how many
+    decoded images and pending results are held in memory at once.
+
+    on_done(item, outputs, error, seconds) is called once per item, never
+    concurrently, with the end-to-end time of that item. An exception
+    from on_done is logged and the pipeline keeps draining.
+    """
+    items = list(items)
+    decode_workers = max(1, int(decode_workers))
+    write_workers = max(1, int(write_workers))
+    queue_depth = max(1, int(queue_depth))
+
+    stats = StageStats()
+    work_q = queue.Queue()
+    decoded_q = queue.Queue(maxsize=queue_depth)
+    write_q = queue.Queue(maxsize=queue_depth)
+    done_lock = threading.Lock()
+    started = {}
+
+    for idx, item in enumerate(items):
+        work_q.put((idx, item))
+
+    def finish(idx, item, outputs, error):
+        with done_lock:
+            try:
+                on_done(item, outputs, error, time.perf_counter() - started[idx])
+            except Exception as exc:
+                # A dead writer would leave inference blocked on write_q
+                print(f"Could not record a finished item: {type(exc).__name__}: {exc}")
+
+    def decoder():
+        while True:
+            try:
+                idx, item = work_q.get_nowait()
+            except queue.Empty:
+                break
+            started[idx] = time.perf_counter()
+            decoded, error = None, None
+            try:
+                decoded = decode(item)
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            stats.add("decode", time.perf_counter() - started[idx])
+            decoded_q.put((idx, item, decoded, error))
+        decoded_q.put(_DONE)
+
+    def writer():
+        while True:
+            job = write_q.get()
+            if job is _DONE:
+                break
+            idx, item, result, error = job
+            outputs = None
+            if error is None:
+                t0 = time.perf_counter()
+                try:
+                    outputs = write(item, result)
+                except Exception as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                stats.add("write", time.perf_counter() - t0)
+            finish(idx, item, outputs, error)
+
+    wall_start = time.perf_counter()
+    decoders = [
+        threading.Thread(target=decoder, name=f"sam3-decode-{i}", daemon=True)
+        for i in range(decode_workers)
+    ]
+    writers = [
+        threading.Thread(target=writer, name=f"sam3-write-{i}", daemon=True)
+        for i in range(write_workers)
+    ]
+    for t in decoders + writers:
+        t.start()
+
+    # Inference stays on this thread
+    finished_decoders = 0
+    while finished_decoders < decode_workers:
+        job = decoded_q.get()
+        if job is _DONE:
+            finished_decoders += 1
+            continue
+
+        idx, item, decoded, error = job
+        del job  # only `decoded` may keep the image alive
+        result = None
+        if error is None:
+            t0 = time.perf_counter()
+            try:
+                result = infer(item, decoded)
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+            stats.add("infer", time.perf_counter() - t0)
+        del decoded  # release the decoded image before blocking on the writers
+        write_q.put((idx, item, result, error))
+
+    for _ in writers:
+        write_q.put(_DONE)
+    for t in writers:
+        t.join()
+
+    wall = time.perf_counter() - wall_start
+    workers = {"decode": decode_workers, "infer": 1, "write": write_workers}
+    if items:
+        stats.report(wall, workers, len(items))
+    return {
+        "wall": wall,
+        "items": len(items),
+        "busy": dict(stats.busy),
+        "workers": workers,
+    }
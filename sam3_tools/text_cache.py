@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+from .shared_utils import get_cache_dir, normalize_prompt
+
+
+ENTRY_KEYS = ("pooler_output", "attention_mask")
+
+
+# ============================================================
+# Text-encoder output cache
+# ============================================================
+class TextEmbeddingCache:
+    """
+    Keeps Sam3Model text-encoder outputs keyed by (prompt, model revision).
+    An entry is the pooled text features plus the attention mask; both
+    live on the CPU and are moved to the model device on use.
+    When persist_dir is set, entries are also written to disk so they
+    survive across processes.
+    """
+
+    def __init__(self, max_entries=256, persist_dir=None):
+        self.max_entries = max_entries
+        self.persist_dir = persist_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha256("\0".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.persist_dir, f"{digest}.pt")
+
+    def _load_from_disk(self, key):
+        if not self.persist_dir:
+            return None
+        path = self._disk_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            entry = torch.load(path, map_location="cpu", weights_only=True)
+        except Exception as exc:
+            print("Ignoring unreadable text cache entry:", exc)
+            return None
+        if not isinstance(entry, dict) or set(entry) != set(ENTRY_KEYS):
+            return None  # written in an older format; re-encode
+        return entry
+
+    def _save_to_disk(self, key, entry):
+        if not self.persist_dir:
+            return
+        path = self._disk_path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            torch.save(entry, tmp)
+            os.replace(tmp, path)
+        except OSError as exc:
+            print("Could not persist text cache entry:", exc)
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model, processor, prompt, revision):
+        """
+        Return {"text_embeds", "attention_mask"} on model.device, ready to
+        pass to Sam3Model.forward.
+        """
+        key = (normalize_prompt(prompt), revision)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+
+        if entry is None:
+            text_inputs = processor(text=key[0], return_tensors="pt").to(model.device)
+            with torch.inference_mode():
+                text_outputs = model.get_text_features(
+                    input_ids=text_inputs["input_ids"],
+                    attention_mask=text_inputs["attention_mask"],
+                )
+            pooled = getattr(text_outputs, "pooler_output", text_outputs)
+            entry = {
+                "pooler_output": pooled.detach().cpu(),
+                "attention_mask": text_inputs["attention_mask"].detach().cpu(),
+            }
+            with self._lock:
+                self._remember(key, entry)
+                self.misses += 1
+            self._save_to_disk(key, entry)
+
+        return {
+            "text_embeds": BaseModelOutputWithPooling(
+                pooler_output=entry["pooler_output"].to(model.device)
+            ),
+            "attention_mask": entry["attention_mask"].to(model.device),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
+_shared_cache = None
+
+
+def get_text_cache(persist=False):
+    """Process-wide cache shared by every text-mode call (CLI, GUI, batch)."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = TextEmbeddingCache()
+    if persist and not _shared_cache.persist_dir:
+        _shared_cache.persist_dir = os.path.join(get_cache_dir(), "text_embeds")
+        os.makedirs(_shared_cache.persist_dir, exist_ok=True)
+    return _shared_cache
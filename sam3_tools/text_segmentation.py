@@ -1,36 +1,43 @@
-from transformers import Sam3Processor, Sam3Model
 import torch
 from PIL import Image
-import numpy as np
 import os
-from datetime import datetime, timezone
+import time
 
 from .shared_utils import (
-    save_pfm,
+    get_model_revision,
+    normalize_prompt,
+    save_masks,
     load_image_rgb,
+    resize_masks,
 )
+from .models import (
+    apply_performance_settings,
+    get_device,
+    in_background,
+    inference_autocast,
+    is_loaded,
+    load_text_model,
+)
+from .text_cache import get_text_cache
 
 
-def run_text_segmentation(input_path, output_path, prompt, num_masks, pfm=False):
-    output_dir = output_path
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Load the image from path (not URL)
-    rgb, _ = load_image_rgb(input_path)
-    if rgb is None:
-        return
-    image = Image.fromarray(rgb)
-
+def predict_text_masks(image, prompt, num_masks, text_cache=None, device=None):
+    """Run Sam3Model on one PIL image; returns up to num_masks (masks, scores)."""
     # Device + models
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model = Sam3Model.from_pretrained("facebook/sam3").to(device)
-    processor = Sam3Processor.from_pretrained("facebook/sam3")
+    device = device or get_device()
+    model, processor = load_text_model(device)
+
+    # Prepare inputs; the prompt encoding comes from the shared text cache
+    if text_cache is None:
+        text_cache = get_text_cache()
+    text_inputs = text_cache.get(model, processor, prompt, get_model_revision())
+    inputs = processor(images=image, return_tensors="pt").to(device)
 
-    # Prepare inputs
-    inputs = processor(images=image, text=prompt, return_tensors="pt").to(device)
+    with torch.no_grad(), inference_autocast(device):
+        outputs = model(pixel_values=inputs["pixel_values"], **text_inputs)
 
-    with torch.no_grad():
-        outputs = model(**inputs)
+    stats = text_cache.stats()
+    print(f"Text cache: {stats['hits']} hits, {stats['disk_hits']} disk hits, {stats['misses']} misses")
 
     results = processor.post_process_instance_segmentation(
         outputs,
@@ -46,27 +53,68 @@ def run_text_segmentation(input_path, output_path, prompt, num_masks, pfm=False)
 
     if len(masks) == 0:
         print("No masks found.")
-        return
+        return [], []
 
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
     count = min(num_masks, len(masks))
-    ts = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-    # Save masks
-    for i in range(count):
-        if not pfm:
-            # Save to PNG
-            mask = masks[i].cpu().numpy().astype(np.uint8) * 255
-            out_path = f"{output_dir}/{base_name}_{ts}_mask_{i}.png"
-            Image.fromarray(mask).save(out_path)
-            print(f"Saved mask {i} (score={scores[i]:.4f}) → {out_path}")
-        else:
-            # Save to PFM
-            m = masks[i].cpu().numpy()
-            seg = np.squeeze(m).astype(np.float32)  # float32 mask for PFM
-            out_path = f"{output_dir}/{base_name}_{ts}_mask_{i}.pfm"
-            save_pfm(out_path, seg)
-            print(f"Saved mask {i} (score={scores[i]:.4f}) → {out_path}")
-
-
-if __name__ == "__main__":
-    main()
+    masks = [masks[i].cpu().numpy() for i in range(count)]
+    scores = [float(scores[i]) for i in range(count)]
+    return masks, scores
+
+
+def run_text_segmentation(
+    input_path,
+    output_path,
+    prompt,
+    num_masks,
+    pfm=False,
+    text_cache=None,
+    result_store=None,
+    memory=None,
+):
+    start = time.perf_counter()
+    output_dir = output_path
+    os.makedirs(output_dir, exist_ok=True)
+    apply_performance_settings()
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+
+    # Identical request already answered? Skip decode + model entirely
+    store_key = None
+    if result_store is not None and os.path.isfile(input_path):
+        store_key = result_store.make_key(
+            input_path, "text", {"prompt": normalize_prompt(prompt)}, num_masks
+        )
+        cached = result_store.get(store_key)
+        if cached is not None:
+            masks, scores = cached
+            print(f"Result store hit ({len(masks)} masks)")
+            return save_masks(masks, output_dir, base_name, pfm=pfm, scores=scores)
+
+    # Load the model while the image decodes
+    in_background(load_text_model, get_device())
+
+    # Pick a decode scale that fits the memory budget, if one is set
+    plan = None
+    if memory is not None:
+        plan = memory.plan(input_path, "text", num_masks, model_loaded=is_loaded("text"))
+
+    # Load the image from path (not URL)
+    rgb, _ = load_image_rgb(input_path, scale=plan.scale if plan else 1.0, bgr=False)
+    if rgb is None:
+        return None
+    image = Image.fromarray(rgb)
+    del rgb
+
+    if memory is not None:
+        memory.check("inference")
+    masks, scores = predict_text_masks(image, prompt, num_masks, text_cache=text_cache)
+    print(f"Time to first mask: {time.perf_counter() - start:.2f}s")
+    if not masks:
+        return []
+    if plan is not None and plan.scale < 1.0:
+        masks = resize_masks(masks, (plan.width, plan.height))
+        store_key = None  # upscaled masks must not answer full-resolution requests
+
+    if store_key is not None:
+        result_store.put(store_key, masks, scores)
+
+    return save_masks(masks, output_dir, base_name, pfm=pfm, scores=scores)
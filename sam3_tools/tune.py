@@ -0,0 +1,182 @@
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from .models import apply_performance_settings, get_device
+from .shared_utils import (
+    get_config_path,
+    load_or_create_config,
+    machine_fingerprint,
+    save_config,
+)
+
+
+IMAGE_SIZE = 512  # synthetic image side; SAM3 itself runs at 1008
+UPSAMPLE_SIZE = 1024  # mask logits upsampled on the CPU, as in post-processing
+TUNE_POINTS = 256  # prompt points decoded per points_per_batch trial
+
+
+# ============================================================
+# Stand-in model
+# ============================================================
+class StandInModel(nn.Module):
+    """
+    Small ViT-style encoder plus a cross-attention point decoder. It has
+    the same kinds of ops as SAM3 (patch conv, attention, MLP, mask
+    dot-products) so relative timings carry over, without downloading
+    the real checkpoint.
+    """
+
+    def __init__(self, dim=192, depth=4, heads=6, patch=16):
+        super().__init__()
+        self.patch_embed = nn.Conv2d(3, dim, patch, stride=patch)
+        layer = nn.TransformerEncoderLayer(dim, heads, dim * 4, batch_first=True)
+        self.encoder = nn.TransformerEncoder(layer, depth)
+        self.point_embed = nn.Linear(2, dim)
+        self.decoder = nn.MultiheadAttention(dim, heads, batch_first=True)
+        self.mask_tokens = nn.Linear(dim, dim * 3)  # 3 candidate masks per point
+
+    def encode(self, images):
+        x = self.patch_embed(images).flatten(2).transpose(1, 2)
+        return self.encoder(x)
+
+    def decode(self, features, points):
+        queries = self.point_embed(points)
+        queries, _ = self.decoder(queries, features, features)
+        tokens = self.mask_tokens(queries).unflatten(-1, (3, -1))
+        return torch.einsum("bpkd,btd->bpkt", tokens, features)
+
+
+# ============================================================
+# Timing helpers
+# ============================================================
+def _sync(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def _time(fn, device, repeats=3):
+    with torch.inference_mode():
+        fn()  # warm-up
+        _sync(device)
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            _sync(device)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def _precision_context(device_type, precision):
+    if precision == "float32":
+        return torch.autocast(device_type=device_type, enabled=False)
+    return torch.autocast(device_type=device_type, dtype=getattr(torch, precision))
+
+
+def _thread_candidates():
+    cores = os.cpu_count() or 1
+    return sorted({n for n in (1, 2, 4, 8, 16, cores // 2, cores) if 1 <= n <= cores})
+
+
+def _precision_candidates(device):
+    if torch.device(device).type == "cuda":
+        names = ["float32", "float16"]
+        if torch.cuda.is_bf16_supported():
+            names.append("bfloat16")
+        return names
+    return ["float32", "bfloat16"]
+
+
+# ============================================================
+# Autotuner
+# ============================================================
+def run_tune(device=None, min_gain=0.05):
+    """
+    Benchmark this machine and store the fastest settings in the config.
+    Reduced precision is only chosen when it beats float32 by min_gain.
+    """
+    device = str(device or get_device())
+    print("Tuning on device:", device)
+
+    model = StandInModel().to(device).eval()
+    image = torch.rand(1, 3, IMAGE_SIZE, IMAGE_SIZE, device=device)
+    perf = {"device": torch.device(device).type}
+
+    # Thread count: only CPU-side torch work uses these threads, even when
+    # inference runs on a GPU, so time a CPU encode plus mask upsampling
+    cpu_model = model if perf["device"] == "cpu" else StandInModel().eval()
+    cpu_image = image.cpu()
+    logits = torch.rand(1, 32, IMAGE_SIZE // 2, IMAGE_SIZE // 2)
+
+    def cpu_work():
+        cpu_model.encode(cpu_image)
+        F.interpolate(logits, size=(UPSAMPLE_SIZE, UPSAMPLE_SIZE), mode="bilinear")
+
+    timings = {}
+    for n in _thread_candidates():
+        torch.set_num_threads(n)
+        timings[n] = _time(cpu_work, "cpu")
+        print(f"  threads={n:<3} {timings[n] * 1000:8.1f} ms")
+    perf["torch_threads"] = min(timings, key=timings.get)
+    torch.set_num_threads(perf["torch_threads"])
+
+    # Precision (autocast, as used at inference time)
+    timings = {}
+    for name in _precision_candidates(device):
+
+        def encode():
+            with _precision_context(perf["device"], name):
+                return model.encode(image)
+
+        try:
+            timings[name] = _time(encode, device)
+        except RuntimeError as exc:
+            print(f"  precision={name} unsupported: {exc}")
+            continue
+        print(f"  precision={name:<9} {timings[name] * 1000:8.1f} ms")
+    best = min(timings, key=timings.get)
+    if timings[best] > timings["float32"] * (1 - min_gain):
+        best = "float32"
+    perf["precision"] = best
+
+    # points_per_batch for auto mode, at the chosen precision
+    with torch.inference_mode(), _precision_context(perf["device"], best):
+        features = model.encode(image)
+    points = torch.rand(1, TUNE_POINTS, 2, device=device)
+    timings = {}
+    for ppb in (16, 32, 64, 128, 256):
+
+        def decode_all():
+            with _precision_context(perf["device"], best):
+                for start in range(0, TUNE_POINTS, ppb):
+                    model.decode(features, points[:, start : start + ppb])
+
+        try:
+            timings[ppb] = _time(decode_all, device)
+        except torch.cuda.OutOfMemoryError:
+            print(f"  points_per_batch={ppb} out of memory")
+            break
+        print(f"  points_per_batch={ppb:<4} {timings[ppb] * 1000:8.1f} ms")
+    perf["points_per_batch"] = min(timings, key=timings.get)
+
+    perf["machine"] = machine_fingerprint()
+    perf["tuned_at"] = datetime.now(timezone.utc).isoformat()
+
+    config = load_or_create_config()
+    config["performance"].update(perf)
+    save_config(config)
+    apply_performance_settings(reload=True)
+
+    print(
+        f"Tuned: threads={perf['torch_threads']}, precision={perf['precision']}, "
+        f"points_per_batch={perf['points_per_batch']}"
+    )
+    print("Saved to:", get_config_path())
+    return perf
+
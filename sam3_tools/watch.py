@@ -0,0 +1,247 @@
+import os
+import queue
+import time
+from pathlib import Path
+
+from .auto_segmentation import run_auto_segmentation
+from .batch import IMAGE_EXTENSIONS, prefetch_model
+from .box_segmentation import run_box_segmentation
+from .exemplar_segmentation import run_exemplar_segmentation
+from .models import apply_performance_settings, forget_image_encoding
+from .text_segmentation import run_text_segmentation
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional; fall back to polling
+    FileSystemEventHandler = object
+    Observer = None
+
+
+TEMP_SUFFIXES = (".tmp", ".part", ".crdownload", ".partial")
+
+
+def _is_candidate(path):
+    name = os.path.basename(path)
+    if name.startswith(".") or name.lower().endswith(TEMP_SUFFIXES):
+        return False
+    return Path(name).suffix.lower() in IMAGE_EXTENSIONS
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+# ============================================================
+# Change detection
+# ============================================================
+class _EventHandler(FileSystemEventHandler):
+    """Forwards created/modified/moved/closed files into a queue."""
+
+    def __init__(self, events):
+        self.events = events
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        path = getattr(event, "dest_path", "") or event.src_path
+        if event.event_type in ("created", "modified", "moved", "closed"):
+            self.events.put(path)
+
+
+class FolderWatcher:
+    """
+    Reports image files that appeared or changed in a folder. Uses
+    watchdog (inotify / FSEvents / ReadDirectoryChangesW) when it is
+    installed and falls back to polling directory listings otherwise.
+    """
+
+    def __init__(self, folder, poll_interval=1.0):
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self._events = queue.Queue()
+        self._observer = None
+        self._listing = self._scan()
+
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self._events), folder, recursive=False)
+            self._observer.start()
+            print("Watching with native file events:", folder)
+        else:
+            print("Watching by polling every", poll_interval, "s:", folder)
+
+    def _scan(self):
+        listing = {}
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and _is_candidate(entry.path):
+                st = entry.stat()
+                listing[entry.path] = (st.st_size, st.st_mtime_ns)
+        return listing
+
+    def changed(self, timeout):
+        """Paths created or modified since the last call."""
+        paths = set()
+        if self._observer is not None:
+            try:
+                paths.add(self._events.get(timeout=timeout))
+                while True:
+                    paths.add(self._events.get_nowait())
+            except queue.Empty:
+                pass
+        else:
+            time.sleep(timeout)
+            listing = self._scan()
+            for path, sig in listing.items():
+                if self._listing.get(path) != sig:
+                    paths.add(path)
+            self._listing = listing
+        return {os.path.abspath(p) for p in paths if _is_candidate(p)}
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+
+# ============================================================
+# Watch loop
+# ============================================================
+def run_watch(
+    watch_dir,
+    output_path,
+    mode,
+    num_masks,
+    pfm=False,
+    prompt=None,
+    box=None,
+    settle_time=1.0,
+    poll_interval=1.0,
+    result_store=None,
+    text_cache=None,
+    memory=None,
+    dedup_iou=0.7,
+):
+    """
+    Segment images as they land in watch_dir, keeping the model loaded.
+
+    A file is processed once its size and mtime have not changed for
+    settle_time seconds. Repeated events for an unchanged file are ignored;
+    a file that is rewritten is processed again. Files already present when
+    the watch starts are left alone (use a batch run for those).
+    """
+    if not output_path:
+        print("Output path is required.")
+        return None
+    if mode in ("box", "exemplar") and box is None:
+        print(f"Watch {mode} mode needs box coordinates (-s x1 y1 x2 y2).")
+        return None
+    if os.path.abspath(output_path) == os.path.abspath(watch_dir):
+        print("Output folder must differ from the watched folder.")
+        return None
+
+    os.makedirs(output_path, exist_ok=True)
+    apply_performance_settings()
+
+    # Warm the model up front so the first file doesn't pay for it
+    prefetch_model(mode)
+
+    watcher = FolderWatcher(watch_dir, poll_interval=poll_interval)
+    pending = {}  # path -> [arrived_at, signature, stable_since]
+    done = {}  # path -> signature last processed
+    processed = 0
+
+    try:
+        while True:
+            now = time.monotonic()
+            for path in watcher.changed(timeout=poll_interval if not pending else 0.2):
+                sig = _signature(path)
+                if sig is None or done.get(path) == sig:
+                    continue
+                entry = pending.get(path)
+                if entry is None:
+                    pending[path] = [now, sig, now]
+                elif entry[1] != sig:
+                    entry[1], entry[2] = sig, now
+
+            now = time.monotonic()
+            for path in list(pending):
+                arrived, sig, stable_since = pending[path]
+                current = _signature(path)
+                if current is None:
+                    del pending[path]  # removed before it settled
+                    continue
+                if current != sig:
+                    pending[path][1:] = [current, now]
+                    continue
+                if current[0] == 0 or now - stable_since < settle_time:
+                    continue
+
+                del pending[path]
+                done[path] = current
+                try:
+                    if mode == "text":
+                        outputs = run_text_segmentation(
+                            path,
+                            output_path,
+                            prompt,
+                            num_masks,
+                            pfm=pfm,
+                            text_cache=text_cache,
+                            result_store=result_store,
+                            memory=memory,
+                        )
+                    elif mode == "auto":
+                        outputs = run_auto_segmentation(
+                            path,
+                            output_path,
+                            num_masks,
+                            pfm=pfm,
+                            result_store=result_store,
+                            dedup_iou=dedup_iou,
+                            memory=memory,
+                        )
+                    elif mode == "exemplar":
+                        outputs = run_exemplar_segmentation(
+                            path,
+                            output_path,
+                            num_masks,
+                            box=box,
+                            pfm=pfm,
+                            result_store=result_store,
+                            memory=memory,
+                        )
+                    else:
+                        outputs = run_box_segmentation(
+                            path,
+                            output_path,
+                            num_masks=num_masks,
+                            box=box,
+                            pfm=pfm,
+                            result_store=result_store,
+                            memory=memory,
+                        )
+                except Exception as exc:
+                    print(f"Failed to process {path}: {type(exc).__name__}: {exc}")
+                    outputs = None
+                forget_image_encoding()  # don't hold it while idle
+
+                latency = time.monotonic() - arrived
+                processed += 1
+                if outputs is None:
+                    print(f"{os.path.basename(path)}: failed after {latency:.2f}s")
+                else:
+                    print(
+                        f"{os.path.basename(path)}: {len(outputs)} mask(s) written "
+                        f"{latency:.2f}s after arrival"
+                    )
+    except KeyboardInterrupt:
+        print(f"Stopped watching; {processed} file(s) processed.")
+    finally:
+        watcher.stop()
+    return processed
+
@@ -0,0 +1,133 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from sam3_tools import models
+
+
+def _tiny_checkpoint(path):
+    """Randomly initialised sam3_video checkpoint laid out like facebook/sam3."""
+    backbone = {
+        "hidden_size": 32,
+        "intermediate_size": 64,
+        "num_hidden_layers": 2,
+        "num_attention_heads": 2,
+        "image_size": 56,
+        "patch_size": 14,
+        "window_size": 2,
+        "global_attn_indexes": [1],
+        "pretrain_image_size": 28,
+    }
+    vision = {
+        "backbone_config": backbone,
+        "fpn_hidden_size": 32,
+        "backbone_feature_sizes": [[16, 16], [8, 8], [4, 4]],
+    }
+    block = {"hidden_size": 32, "num_attention_heads": 2, "intermediate_size": 64}
+    detector = {
+        "vision_config": vision,
+        "text_config": {
+            "hidden_size": 32,
+            "intermediate_size": 64,
+            "num_hidden_layers": 1,
+            "num_attention_heads": 2,
+            "projection_dim": 32,
+        },
+        "geometry_encoder_config": {**block, "num_layers": 1},
+        "detr_encoder_config": {**block, "num_layers": 1},
+        "detr_decoder_config": {**block, "num_layers": 1, "num_queries": 8},
+        "mask_decoder_config": {"hidden_size": 32, "num_attention_heads": 2},
+    }
+    tracker = {
+        "vision_config": vision,
+        "prompt_encoder_config": {"hidden_size": 32, "image_size": 56, "patch_size": 14},
+        "mask_decoder_config": {
+            "hidden_size": 32,
+            "num_attention_heads": 2,
+            "mlp_dim": 64,
+            "iou_head_hidden_dim": 32,
+        },
+        "memory_attention_hidden_size": 32,
+        "memory_encoder_hidden_size": 32,
+        "memory_encoder_output_channels": 16,
+        "mem_dim": 16,
+    }
+    config = transformers.Sam3VideoConfig(detector_config=detector, tracker_config=tracker)
+    transformers.Sam3VideoModel(config).save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture
+def tiny_sam3(tmp_path, monkeypatch):
+    checkpoint = _tiny_checkpoint(tmp_path / "sam3")
+    monkeypatch.setattr(models, "MODEL_NAME", checkpoint)
+    monkeypatch.setattr(models, "_loaded", {})
+    monkeypatch.setattr(models, "_shared_backbone", None)
+    monkeypatch.setattr(models, "_bytes_shared", 0)
+    # The tiny checkpoint has no tokenizer or image processor files
+    for cls in (models.Sam3Processor, models.Sam3TrackerProcessor):
+        monkeypatch.setattr(cls, "from_pretrained", classmethod(lambda cls, name: None))
+    return checkpoint
+
+
+def test_text_and_tracker_share_one_backbone(tiny_sam3, capsys):
+    text_model, _ = models.load_text_model("cpu")
+    tracker_model, _ = models.load_tracker_model("cpu")
+    assert "skipped loading" in capsys.readouterr().out
+
+    shared = text_model.vision_encoder.backbone
+    assert isinstance(shared, models.SharedBackbone)
+    assert tracker_model.vision_encoder.backbone is shared
+
+    # The tracker skipped the backbone tensors but still has the checkpoint's
+    reference = transformers.Sam3TrackerModel.from_pretrained(tiny_sam3)
+    expected = reference.vision_encoder.backbone.state_dict()
+    for name, tensor in shared.backbone.state_dict().items():
+        assert torch.equal(tensor, expected[name]), name
+
+
+def test_model_on_another_device_keeps_its_backbone(tiny_sam3):
+    text_model, _ = models.load_text_model("cpu")
+    tracker_model, _ = models.load_tracker_model("meta")
+
+    backbone = tracker_model.vision_encoder.backbone
+    assert backbone is not text_model.vision_encoder.backbone
+    assert next(backbone.parameters()).device.type == "meta"
+    assert models.model_memory_report()["bytes_saved"] == 0
+
+
+def test_memory_report_counts_shared_weights_once(tiny_sam3):
+    text_model, _ = models.load_text_model("cpu")
+    tracker_model, _ = models.load_tracker_model("cpu")
+
+    backbone_bytes = models._param_bytes(text_model.vision_encoder.backbone)
+    separate = models._param_bytes(text_model) + models._param_bytes(tracker_model)
+
+    report = models.model_memory_report()
+    assert sorted(report["models"]) == ["text", "tracker"]
+    assert report["bytes_saved"] == backbone_bytes > 0
+    assert report["bytes"] == separate - backbone_bytes
+    assert report["bytes_without_sharing"] == separate
+
+    text_ptrs = {p.data_ptr() for p in text_model.parameters()}
+    tracker_ptrs = {p.data_ptr() for p in tracker_model.parameters()}
+    backbone_ptrs = {p.data_ptr() for p in text_model.vision_encoder.backbone.parameters()}
+    assert text_ptrs & tracker_ptrs == backbone_ptrs
+
+
+def test_image_encoding_is_reused_and_forgotten(tiny_sam3):
+    text_model, _ = models.load_text_model("cpu")
+    shared = text_model.vision_encoder.backbone
+    pixels = torch.rand(1, 3, 56, 56)
+
+    with torch.inference_mode():
+        first = shared(pixels)
+        again = shared(pixels.clone())
+    assert again is first
+    assert (shared.hits, shared.misses) == (1, 1)
+
+    models.forget_image_encoding()
+    with torch.inference_mode():
+        shared(pixels)
+    assert shared.misses == 2